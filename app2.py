@@ -1,82 +1,50 @@
-import os
-import json
-from dotenv import load_dotenv
 import streamlit as st
-import requests
+from core.client import get_chat_client, is_error_response
+from core.config import ChatSettings, get_secret, load_environment
+from core.history import new_conversation_state, new_message
+from core.redaction import install_log_redaction
+from core.rendering import MarkdownCache
+from core.validation import validate_input
 
 # Step 1: Load environment variables from .env
-load_dotenv()
-
-# Step 2: Retrieve the NVIDIA API key from the environment variables
-def get_nvidia_api_key():
-    """Retrieve NVIDIA API key from environment variable."""
-    nvidia_api_key = os.getenv("NVIDIA_API_KEY")
-    if not nvidia_api_key:
-        raise ValueError("NVIDIA_API_KEY environment variable is not set")
-    return nvidia_api_key
-
-# Configuration
-MODEL = "nvidia/llama-3.1-nemotron-70b-instruct"
-TEMPERATURE = 0.5
-TOP_P = 1
-MAX_TOKENS = 1024
-API_BASE = "https://integrate.api.nvidia.com/v1"
-
-def generate_response(user_input, conversation_history, api_key):
-    """Generate response from NVIDIA LLaMA API."""
-    try:
-        url = f"{API_BASE}/chat/completions"
-        headers = {
-            "Authorization": f"Bearer {api_key}",
-            "Content-Type": "application/json"
-        }
-        data = {
-            "model": MODEL,
-            "messages": [{"role": "user", "content": user_input}],
-            "temperature": TEMPERATURE,
-            "top_p": TOP_P,
-            "max_tokens": MAX_TOKENS
-        }
-
-        response = requests.post(url, headers=headers, json=data)
-
-        # Debugging: Log request and response details (Remove in production)
-        # print(f"Request URL: {url}")
-        # print(f"Request Headers: {headers}")
-        # print(f"Request Body: {data}")
-        # print(f"Response Status Code: {response.status_code}")
-        # print(f"Response Body: {response.text}")
-
-        response.raise_for_status()  # Raise an exception for HTTP errors
-
-        response_json = response.json()
-        response_text = response_json['choices'][0]['message']['content']
-        return response_text
-
-    except requests.exceptions.HTTPError as http_err:
-        return f"HTTP Error: {http_err}"
-    except Exception as err:
-        return f"Error: {err}"
-
-def validate_input(user_input):
-    """Implement your validation logic here (e.g., check for specific keywords, length, etc.)."""
-    # Example: Check for empty input
-    if not user_input.strip():
-        return False
-    return True
-
-def send_message(api_key):
+load_environment()
+
+# Mask API keys and bearer tokens in log output (after .env, so its keys are known)
+install_log_redaction()
+
+# Configuration (every setting and its default is listed in core/config.py)
+settings = ChatSettings(
+    "nvidia",
+    model="nvidia/llama-3.1-nemotron-70b-instruct",
+    temperature=0.5,
+    top_p=1,
+    max_tokens=1024,
+    stream_responses=False
+)
+
+def generate_response(conversation_state, client):
+    """Generate a reply to the latest user message, sending as much history as fits the prompt budget."""
+    prompt_messages = client.context_window.build(conversation_state)
+    response_text, _ = client.generate_response(prompt_messages)
+    return response_text
+
+def send_message(client):
     user_input = st.session_state.user_input
     if user_input.lower() == 'quit':
-        st.session_state.conversation_history = "Goodbye!"
-        st.session_state.user_input_history = []
-    elif validate_input(user_input):
-        st.session_state.user_input_history.append("User: " + user_input)
-        response = generate_response(user_input, "\n".join(st.session_state.user_input_history), api_key)
-        st.session_state.user_input_history.append("LLaMA: " + response)
-        st.session_state.conversation_history = "\n".join(st.session_state.user_input_history)
-
-        if response.startswith("Error") or response.startswith("HTTP Error"):
+        st.session_state.conversation_state = new_conversation_state()
+        st.write("Goodbye!")
+    else:
+        problem = validate_input(user_input)
+        if problem:
+            # Keep the input, so it can be shortened instead of retyped
+            st.warning(problem)
+            return
+        messages = st.session_state.conversation_state['messages']
+        messages.append(new_message('user', user_input))
+        response = generate_response(st.session_state.conversation_state, client)
+        messages.append(new_message('assistant', response))
+
+        if is_error_response(response):
             st.error(response)
         else:
             st.write("LLaMA:", response)
@@ -85,13 +53,17 @@ def send_message(api_key):
     st.session_state.user_input = ""
 
 def main():
-    nvidia_api_key = get_nvidia_api_key()
+    # Retrieve the key of the provider in use: NVIDIA unless CHAT_PROVIDER selects another (a local one needs none)
+    if settings.requires_api_key and not get_secret(settings.api_key_name):
+        st.error(f"{settings.api_key_name} environment variable is not set")
+        st.stop()
+    client = get_chat_client(settings)
 
     # Initialize Session State for Conversation History
-    if 'conversation_history' not in st.session_state:
-        st.session_state.conversation_history = ""
-    if 'user_input_history' not in st.session_state:
-        st.session_state.user_input_history = []
+    if 'conversation_state' not in st.session_state:
+        st.session_state.conversation_state = new_conversation_state()
+    if 'markdown_cache' not in st.session_state:
+        st.session_state.markdown_cache = MarkdownCache()
     if 'user_input' not in st.session_state:
         st.session_state.user_input = ""
 
@@ -103,16 +75,20 @@ def main():
     user_input = st.text_input("You:", value="", key="user_input")
 
     # Send Button with Callback
-    st.button("Send", on_click=send_message, args=(nvidia_api_key,))
-
-    # Display Conversation History
-    st.write("**Conversation History:**")
-    st.write(st.session_state.conversation_history)
+    st.button("Send", on_click=send_message, args=(client,))
 
     # Security Improvement: Limit Conversation History Size
-    if len(st.session_state.user_input_history) > 20:
-        st.session_state.user_input_history = st.session_state.user_input_history[-20:]
-        st.session_state.conversation_history = "\n".join(st.session_state.user_input_history)
+    # (ten messages are dropped at once, so the prompt prefix stays cacheable in between)
+    messages = st.session_state.conversation_state['messages']
+    if len(messages) > 20:
+        del messages[:-10]
+
+    # Display Conversation History, one element per message; only new messages are formatted
+    st.write("**Conversation History:**")
+    st.session_state.markdown_cache.retain(messages)
+    for msg in messages:
+        label = "User" if msg['role'] == 'user' else "LLaMA"
+        st.markdown(st.session_state.markdown_cache.render(msg['id'], label, msg['content']))
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,193 @@
+"""
+Batch/offline inference over a JSONL file of prompts.
+
+Each input line is either {"id": ..., "messages": [...]} or
+{"id": ..., "prompt": "...", "system": "..."}. Requests go through the same
+client as the chat UI, built from the chosen app's settings (request
+building, response cache, provider routing, retries and rate limits), run
+concurrently up to a limit, and results are appended to the output JSONL as
+they finish. Re-running the
+same command resumes an interrupted job: IDs that already have a successful
+result in the output file are skipped. A malformed input line is recorded as
+an error result with a "problem" field instead of stopping the job.
+
+Usage:
+    python batch.py prompts.jsonl results.jsonl --app app0 --concurrency 16 --rpm 300
+"""
+import argparse
+import importlib
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from itertools import islice
+
+from core.client import ChatClient, is_error_response
+from core.config import get_secret
+from core.context import count_tokens_batch
+from core.providers import Provider
+
+
+# Function to read the IDs already completed in an output file
+def load_checkpoint(path):
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # A line cut short by an interruption
+            if not record.get("error"):
+                done.add(str(record["id"]))
+    return done
+
+
+# Function to stream the prompts of an input file
+def iter_prompts(path, done):
+    """
+    Yields (id, messages, problem) for every prompt not yet completed. For a
+    malformed line, messages is None and problem says what is wrong with it.
+    """
+    with open(path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                yield str(line_number), None, f"Line {line_number} is not valid JSON: {e}"
+                continue
+            if not isinstance(record, dict):
+                yield str(line_number), None, f"Line {line_number} is not a JSON object"
+                continue
+            prompt_id = str(record.get("id", line_number))
+            if prompt_id in done:
+                continue
+            messages = record.get("messages")
+            if messages is None:
+                if not isinstance(record.get("prompt"), str):
+                    yield prompt_id, None, f"Line {line_number} has neither \"messages\" nor a \"prompt\" string"
+                    continue
+                messages = []
+                if record.get("system"):
+                    messages.append({'role': 'system', 'content': record["system"]})
+                messages.append({'role': 'user', 'content': record["prompt"]})
+            yield prompt_id, messages, None
+
+
+# Function to read prompts in chunks, with their token counts computed together
+def iter_prompt_chunks(prompts, size=256):
+    """
+    Tokenizes each chunk's messages in one batch call, so the per-request
+    pre-flight estimate only finds cached counts.
+    """
+    prompts = iter(prompts)
+    while chunk := list(islice(prompts, size)):
+        count_tokens_batch([
+            msg['content'] for _, messages, _ in chunk for msg in messages or ()
+            if isinstance(msg, dict) and isinstance(msg.get('content'), str)
+        ])
+        yield from chunk
+
+
+# Function to build a client with the settings of an app
+def load_client(name, requests_per_minute, tokens_per_minute, api_base=None):
+    """
+    :param api_base: Optional URL replacing the providers, e.g. a local mock or inference server.
+    """
+    settings = importlib.import_module(name).settings
+    overrides = {"max_queue_wait": None}  # Batch jobs wait for quota instead of failing over
+    if requests_per_minute:
+        overrides["requests_per_minute"] = requests_per_minute
+    if tokens_per_minute:
+        overrides["tokens_per_minute"] = tokens_per_minute
+    settings = settings.replace(**overrides)
+    providers = None
+    if api_base:
+        providers = [Provider(
+            settings.primary, api_base, get_secret(settings.api_key_name), settings.model,
+            settings.requests_per_minute, settings.tokens_per_minute
+        )]
+    return ChatClient(settings, providers)
+
+
+# Function to run one prompt
+def run_prompt(client, prompt_id, messages):
+    start = time.perf_counter()
+    text, complete = client.generate_response(messages)
+    return {
+        "id": prompt_id,
+        "response": text,
+        "complete": complete,
+        "error": is_error_response(text),
+        "latency_s": round(time.perf_counter() - start, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a JSONL file of prompts through the chat request path")
+    parser.add_argument("input", help="JSONL file of prompts")
+    parser.add_argument("output", help="JSONL file results are appended to; also the resume checkpoint")
+    parser.add_argument("--app", choices=("app", "app0"), default="app0", help="App whose providers and settings are used")
+    parser.add_argument("--concurrency", type=int, default=8, help="Requests in flight at once")
+    parser.add_argument("--rpm", type=int, help="Requests per minute per provider")
+    parser.add_argument("--tpm", type=int, help="Tokens per minute per provider")
+    parser.add_argument("--api-base", help="Send every request to this OpenAI-compatible base URL instead")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    logging.getLogger("streamlit").setLevel(logging.ERROR)
+
+    client = load_client(args.app, args.rpm, args.tpm, args.api_base)
+    done = load_checkpoint(args.output)
+    if done:
+        logging.info(f"Resuming: {len(done)} prompts already completed")
+
+    lock = threading.Lock()
+    completed, failed = 0, 0
+    start = time.perf_counter()
+    with open(args.output, "a", encoding="utf-8") as out, ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        pending = set()
+
+        def write(result):
+            nonlocal completed, failed
+            with lock:
+                out.write(json.dumps(result) + "\n")
+                out.flush()
+                completed += 1
+                failed += result["error"]
+
+        # Written as soon as each prompt finishes, so an interruption loses none of the finished ones
+        def write_result(future, prompt_id):
+            if future.exception() is not None:
+                logging.error(f"Prompt {prompt_id} failed: {future.exception()}")
+                write({"id": prompt_id, "response": None, "complete": False, "error": True})
+            else:
+                write(future.result())
+
+        # Keep a bounded number of prompts queued so huge files are never fully loaded
+        for prompt_id, messages, problem in iter_prompt_chunks(iter_prompts(args.input, done)):
+            if problem:
+                logging.warning(problem)
+                write({"id": prompt_id, "response": None, "complete": False, "error": True, "problem": problem})
+                continue
+            if len(pending) >= args.concurrency * 2:
+                _, pending = wait(pending, return_when=FIRST_COMPLETED)
+            future = pool.submit(run_prompt, client, prompt_id, messages)
+            future.add_done_callback(lambda future, prompt_id=prompt_id: write_result(future, prompt_id))
+            pending.add(future)
+        wait(pending)
+
+    elapsed = time.perf_counter() - start
+    logging.info(f"Finished {completed} prompts ({failed} errors) in {elapsed:.1f}s")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,3 @@
+"""
+Offline mock upstream and load-testing tools for the chatbot apps.
+"""
@@ -0,0 +1,278 @@
+"""
+Local OpenAI-compatible mock of the chat completions API.
+
+Latencies are drawn from configurable distributions, replies can be streamed
+as server-sent events, and errors (500, 429 with Retry-After, hung requests)
+are injected at configurable rates, so the apps can be load-tested without
+paying for real API calls.
+
+Usage:
+    python -m bench.mock_server --port 8000 --ttft lognormal:0.4,0.5 --token-delay uniform:0.01,0.03
+Then point a provider at http://127.0.0.1:8000/v1.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import math
+import random
+import threading
+import time
+
+from aiohttp import web
+
+WORDS = (
+    "the GPU model tensor kernel memory latency throughput batch token layer "
+    "attention cache request stream response inference parallel compute"
+).split()
+
+
+class Distribution:
+    """
+    A latency or length distribution parsed from "kind:arg1,arg2".
+
+    Supported kinds: fixed:v, uniform:low,high, normal:mean,stddev,
+    lognormal:median,sigma and exp:mean. Samples are never negative.
+    """
+
+    def __init__(self, spec):
+        self.spec = spec
+        kind, _, args = spec.partition(":")
+        self.kind = kind
+        self.args = [float(a) for a in args.split(",") if a]
+        samplers = {
+            "fixed": lambda v: v,
+            "uniform": random.uniform,
+            "normal": random.gauss,
+            "lognormal": lambda median, sigma: random.lognormvariate(math.log(median), sigma),
+            "exp": lambda mean: random.expovariate(1 / mean),
+        }
+        if kind not in samplers:
+            raise ValueError(f"Unknown distribution {spec!r}")
+        self._sample = samplers[kind]
+
+    def sample(self):
+        return max(0.0, self._sample(*self.args))
+
+    def __repr__(self):
+        return f"Distribution({self.spec!r})"
+
+
+class MockConfig:
+    """
+    Behaviour of the mock server.
+    """
+
+    def __init__(self, ttft="fixed:0.2", token_delay="fixed:0.02", tokens="uniform:50,400",
+                 error_rate=0.0, rate_limit_rate=0.0, hang_rate=0.0, hang_seconds=300.0, retry_after=1):
+        """
+        :param ttft: Delay before the first token (or before the whole reply when not streaming).
+        :param token_delay: Delay between tokens.
+        :param tokens: Reply length in tokens, capped by the request's max_tokens.
+        :param error_rate: Fraction of requests answered with HTTP 500.
+        :param rate_limit_rate: Fraction of requests answered with HTTP 429.
+        :param hang_rate: Fraction of requests that stall for hang_seconds before answering.
+        :param retry_after: Retry-After header sent with 429 responses.
+        """
+        self.ttft = Distribution(ttft)
+        self.token_delay = Distribution(token_delay)
+        self.tokens = Distribution(tokens)
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.hang_rate = hang_rate
+        self.hang_seconds = hang_seconds
+        self.retry_after = retry_after
+
+
+# Function to build the text of a mock reply
+def _reply_tokens(count):
+    tokens = [random.choice(WORDS) for _ in range(count)]
+    if tokens:
+        tokens[0] = tokens[0].capitalize()
+    return [("" if i == 0 else " ") + t for i, t in enumerate(tokens)]
+
+
+# Function to estimate the prompt tokens of a request
+def _prompt_tokens(body):
+    return sum(len(str(msg.get("content", ""))) // 4 + 4 for msg in body.get("messages", []))
+
+
+# Function to encode one SSE event
+def _sse(payload):
+    return f"data: {json.dumps(payload)}\n\n".encode("utf-8")
+
+
+async def chat_completions(request):
+    config = request.app["config"]
+    stats = request.app["stats"]
+    stats["requests"] += 1
+    body = await request.json()
+
+    roll = random.random()
+    if roll < config.error_rate:
+        stats["errors"] += 1
+        return web.json_response({"error": {"message": "Injected server error"}}, status=500)
+    roll -= config.error_rate
+    if roll < config.rate_limit_rate:
+        stats["rate_limited"] += 1
+        return web.json_response({"error": {"message": "Injected rate limit"}}, status=429,
+                                 headers={"Retry-After": str(config.retry_after)})
+    roll -= config.rate_limit_rate
+    if roll < config.hang_rate:
+        stats["hung"] += 1
+        await asyncio.sleep(config.hang_seconds)
+
+    max_tokens = int(body.get("max_tokens") or 1024)
+    wanted = max(1, int(config.tokens.sample()))
+    count = min(max_tokens, wanted)
+    finish_reason = "length" if wanted > max_tokens else "stop"
+    tokens = _reply_tokens(count)
+    if finish_reason == "stop":
+        tokens[-1] += "."
+    usage = {
+        "prompt_tokens": _prompt_tokens(body),
+        "completion_tokens": count,
+        "total_tokens": _prompt_tokens(body) + count,
+    }
+    completion_id = f"chatcmpl-mock-{stats['requests']}"
+    model = body.get("model", "mock")
+    created = int(time.time())
+
+    await asyncio.sleep(config.ttft.sample())
+
+    if not body.get("stream"):
+        await asyncio.sleep(sum(config.token_delay.sample() for _ in range(count - 1)))
+        return web.json_response({
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": created,
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": "".join(tokens)},
+                "finish_reason": finish_reason,
+            }],
+            "usage": usage,
+        })
+
+    response = web.StreamResponse(headers={"Content-Type": "text/event-stream", "Cache-Control": "no-cache"})
+    await response.prepare(request)
+    base = {"id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model}
+    await response.write(_sse(dict(base, choices=[{"index": 0, "delta": {"role": "assistant"}, "finish_reason": None}])))
+    for i, token in enumerate(tokens):
+        if i:
+            await asyncio.sleep(config.token_delay.sample())
+        await response.write(_sse(dict(base, choices=[{"index": 0, "delta": {"content": token}, "finish_reason": None}])))
+    await response.write(_sse(dict(base, choices=[{"index": 0, "delta": {}, "finish_reason": finish_reason}])))
+    if (body.get("stream_options") or {}).get("include_usage"):
+        await response.write(_sse(dict(base, choices=[], usage=usage)))
+    await response.write(b"data: [DONE]\n\n")
+    await response.write_eof()
+    return response
+
+
+async def embeddings(request):
+    body = await request.json()
+    texts = body.get("input") or []
+    if isinstance(texts, str):
+        texts = [texts]
+    data = []
+    for index, text in enumerate(texts):
+        # Bag-of-words hashing, so near-identical texts get similar vectors
+        vector = [0.0] * 64
+        for word in str(text).lower().split():
+            vector[int(hashlib.md5(word.encode("utf-8")).hexdigest(), 16) % 64] += 1.0
+        data.append({"object": "embedding", "index": index, "embedding": vector})
+    return web.json_response({"object": "list", "data": data, "model": body.get("model", "mock")})
+
+
+async def models(request):
+    return web.json_response({"object": "list", "data": [{"id": "mock", "object": "model"}]})
+
+
+# Function to build the mock application
+def create_app(config=None):
+    app = web.Application()
+    app["config"] = config or MockConfig()
+    app["stats"] = {"requests": 0, "errors": 0, "rate_limited": 0, "hung": 0}
+    app.router.add_post("/{prefix:.*}chat/completions", chat_completions)
+    app.router.add_post("/{prefix:.*}embeddings", embeddings)
+    app.router.add_get("/{prefix:.*}models", models)
+    return app
+
+
+class BackgroundMockServer:
+    """
+    Runs the mock server on its own event loop thread, e.g. inside the benchmark.
+    """
+
+    def __init__(self, config=None, host="127.0.0.1", port=0):
+        self.app = create_app(config)
+        self.host = host
+        self.port = port
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name="mock-server", daemon=True)
+        self.runner = None
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}/v1"
+
+    @property
+    def stats(self):
+        return self.app["stats"]
+
+    async def _start(self):
+        self.runner = web.AppRunner(self.app, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, self.host, self.port, backlog=1024)
+        await site.start()
+        self.port = self.runner.addresses[0][1]
+
+    def start(self):
+        self.thread.start()
+        asyncio.run_coroutine_threadsafe(self._start(), self.loop).result()
+        return self
+
+    def stop(self):
+        asyncio.run_coroutine_threadsafe(self.runner.cleanup(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+
+# Function to add the mock behaviour options to a parser
+def add_config_arguments(parser):
+    parser.add_argument("--ttft", default="fixed:0.2", help="Time to first token distribution, e.g. lognormal:0.4,0.5")
+    parser.add_argument("--token-delay", default="fixed:0.02", help="Delay between tokens distribution")
+    parser.add_argument("--tokens", default="uniform:50,400", help="Reply length distribution in tokens")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests failing with HTTP 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Fraction of requests failing with HTTP 429")
+    parser.add_argument("--hang-rate", type=float, default=0.0, help="Fraction of requests that stall")
+    parser.add_argument("--hang-seconds", type=float, default=300.0)
+
+
+# Function to build a MockConfig from parsed arguments
+def config_from_args(args):
+    return MockConfig(
+        ttft=args.ttft,
+        token_delay=args.token_delay,
+        tokens=args.tokens,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        hang_rate=args.hang_rate,
+        hang_seconds=args.hang_seconds,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OpenAI-compatible mock upstream for load tests")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    add_config_arguments(parser)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    web.run_app(create_app(config_from_args(args)), host=args.host, port=args.port, access_log=None)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,228 @@
+"""
+Load-testing harness driving the apps' chat logic with simulated users.
+
+Each simulated user runs a multi-turn conversation through the same
+client the Streamlit UI uses (context window, generate_response or
+generate_response_stream, provider routing), built from the app's settings
+and pointed at the local mock server unless --url is given. Reports
+throughput, time to first token, latency percentiles and memory per session.
+
+Usage:
+    python -m bench.run_benchmark --app app --users 50 --turns 5
+    python -m bench.run_benchmark --app app2 --users 20 --json bench_output.json
+"""
+import argparse
+import importlib
+import json
+import logging
+import os
+import random
+import resource
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from bench.mock_server import BackgroundMockServer, add_config_arguments, config_from_args
+
+PROMPTS = [
+    "What is CUDA and why does it matter for deep learning?",
+    "Explain the difference between latency and throughput.",
+    "Summarize how attention works in transformers.",
+    "Give me three tips for speeding up Python code.",
+    "How does a KV cache reduce inference cost?",
+    "Write a haiku about GPUs.",
+]
+
+
+class Recorder:
+    """Thread-safe collection of per-request measurements."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.ttft = []
+        self.latency = []
+        self.completion_chars = 0
+        self.errors = 0
+
+    def record(self, ttft, latency, text, error):
+        with self.lock:
+            if error:
+                self.errors += 1
+                return
+            self.ttft.append(ttft)
+            self.latency.append(latency)
+            self.completion_chars += len(text)
+
+
+# Function to compute a percentile of a list of samples
+def percentile(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q / 100))]
+
+
+# Function to approximate the memory held by an object graph
+def deep_size(obj, seen=None):
+    seen = seen if seen is not None else set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_size(k, seen) + deep_size(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set)):
+        size += sum(deep_size(item, seen) for item in obj)
+    elif hasattr(obj, "__slots__"):
+        size += sum(deep_size(getattr(obj, s), seen) for s in obj.__slots__ if hasattr(obj, s))
+    elif hasattr(obj, "__dict__"):
+        size += deep_size(vars(obj), seen)
+    return size
+
+
+# Function to import an app module and build its client, pointed at the benchmark upstream
+def load_app(name, url, use_cache):
+    """
+    Imports app.py, app0.py or app2.py outside of `streamlit run` and builds a
+    ChatClient from its settings that sends every request to `url`.
+    :return: The app module and the client.
+    """
+    if not use_cache:
+        os.environ["RESPONSE_CACHE_SIZE"] = "0"
+    # Imported after the cache settings above, which core reads at import time
+    from core.client import ChatClient
+    from core.providers import Provider
+
+    module = importlib.import_module(name)
+    settings = module.settings.replace(hedge_after=0)
+    client = ChatClient(settings, providers=[Provider("benchmark", url, "benchmark", settings.model)])
+    return module, client
+
+
+# Function to simulate one user of app.py or app0.py
+def run_chat_user(client, user_id, turns, stream, recorder, states):
+    from core.client import is_error_response
+    from core.history import new_conversation_state
+
+    state = new_conversation_state()
+    states.append(state)
+    for turn in range(turns):
+        prompt = f"{random.choice(PROMPTS)} (user {user_id}, turn {turn})"
+        state['messages'].append({'role': 'user', 'content': prompt})
+        prompt_messages = client.context_window.build(state)
+        start = time.perf_counter()
+        first_token = None
+        if stream:
+            result = client.generate_response_stream(prompt_messages)
+            if isinstance(result, str):
+                text, error = result, True
+            else:
+                for _ in result:
+                    if first_token is None:
+                        first_token = time.perf_counter()
+                text, error = result.text, result.error is not None
+        else:
+            text, _ = client.generate_response(prompt_messages)
+            error = is_error_response(text)
+        end = time.perf_counter()
+        recorder.record((first_token or end) - start, end - start, text, error)
+        state['messages'].append({'role': 'assistant', 'content': text})
+
+
+# Function to simulate one user of app2.py
+def run_app2_user(app, client, user_id, turns, recorder, states):
+    from core.client import is_error_response
+    from core.history import new_conversation_state, new_message
+
+    state = new_conversation_state()
+    states.append(state)
+    for turn in range(turns):
+        prompt = f"{random.choice(PROMPTS)} (user {user_id}, turn {turn})"
+        state['messages'].append(new_message('user', prompt))
+        start = time.perf_counter()
+        text = app.generate_response(state, client)
+        end = time.perf_counter()
+        recorder.record(end - start, end - start, text, is_error_response(text))
+        state['messages'].append(new_message('assistant', text))
+
+
+# Function to run the benchmark and summarize it
+def run(args):
+    server = None
+    url = args.url
+    if not url:
+        server = BackgroundMockServer(config_from_args(args)).start()
+        url = server.url
+    app, client = load_app(args.app, url, args.cache)
+
+    recorder = Recorder()
+    states = []
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.users) as pool:
+        futures = []
+        for user_id in range(args.users):
+            if args.app == "app2":
+                futures.append(pool.submit(run_app2_user, app, client, user_id, args.turns, recorder, states))
+            else:
+                futures.append(pool.submit(run_chat_user, client, user_id, args.turns, not args.no_stream, recorder, states))
+        for future in futures:
+            future.result()
+    elapsed = time.perf_counter() - start
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    requests_done = len(recorder.latency)
+    report = {
+        "app": args.app,
+        "users": args.users,
+        "turns": args.turns,
+        "stream": args.app != "app2" and not args.no_stream,
+        "elapsed_s": round(elapsed, 3),
+        "requests": requests_done,
+        "errors": recorder.errors,
+        "throughput_rps": round(requests_done / elapsed, 2) if elapsed else None,
+        "completion_chars_per_s": round(recorder.completion_chars / elapsed, 1) if elapsed else None,
+        "ttft_s": {f"p{q}": percentile(recorder.ttft, q) for q in (50, 95, 99)},
+        "latency_s": {f"p{q}": percentile(recorder.latency, q) for q in (50, 95, 99)},
+        "session_state_bytes": round(sum(deep_size(s) for s in states) / max(1, len(states))),
+        # ru_maxrss is in KiB on Linux
+        "peak_rss_growth_per_session_kib": round((rss_after - rss_before) / max(1, args.users), 1),
+    }
+    if server is not None:
+        report["upstream"] = dict(server.stats)
+        server.stop()
+    return report
+
+
+# Function to print a report as a table
+def print_report(report):
+    for key, value in report.items():
+        if isinstance(value, dict):
+            value = ", ".join(f"{k}={v:.3f}" if isinstance(v, float) else f"{k}={v}" for k, v in value.items())
+        print(f"{key:>34}: {value}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Drive the chat apps with concurrent simulated users")
+    parser.add_argument("--app", choices=("app", "app0", "app2"), default="app")
+    parser.add_argument("--users", type=int, default=20, help="Concurrent simulated users")
+    parser.add_argument("--turns", type=int, default=3, help="Conversation turns per user")
+    parser.add_argument("--no-stream", action="store_true", help="Use generate_response instead of streaming")
+    parser.add_argument("--cache", action="store_true", help="Keep the response cache enabled")
+    parser.add_argument("--url", help="Upstream base URL; defaults to an in-process mock server")
+    parser.add_argument("--json", help="Also write the report to this file")
+    add_config_arguments(parser)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    logging.getLogger("streamlit").setLevel(logging.ERROR)
+    report = run(args)
+    print_report(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,30 @@
+import logging
+from core.compare import run_compare_app
+from core.config import ChatSettings, load_environment
+from core.redaction import install_log_redaction
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+
+# Load environment variables from .env (for local development)
+load_environment()
+
+# Mask API keys and bearer tokens in log output (after .env, so its keys are known)
+install_log_redaction()
+
+# Defaults of the variants; every row can be changed on the page
+# (every setting and its default is listed in core/config.py)
+settings = ChatSettings(
+    "deepinfra",
+    model="nvidia/Llama-3.1-Nemotron-70B-Instruct",
+    temperature=0.5,
+    top_p=1,
+    max_tokens=1024
+)
+
+# Main function to run the comparison page
+def main():
+    run_compare_app(settings)
+
+if __name__ == "__main__":
+    main()
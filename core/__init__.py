@@ -0,0 +1,26 @@
+"""
+Shared helpers for the NVIDIA LLaMA chatbot apps.
+
+Importing the package loads .env first, because the core modules read their
+settings from the environment when they are imported.
+"""
+
+_environment_loaded = False
+
+
+# Function to load environment variables from .env (for local development)
+def load_environment():
+    """
+    Loads .env once per process; python-dotenv is only imported the first time,
+    so Streamlit reruns do not re-read the file.
+    """
+    global _environment_loaded
+    if _environment_loaded:
+        return
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    _environment_loaded = True
+
+
+load_environment()
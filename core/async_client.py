@@ -0,0 +1,222 @@
+"""
+Asyncio chat backend: one event loop in a background thread, shared by every
+Streamlit session, multiplexes all upstream requests over an aiohttp pool.
+
+AsyncChatClient.post mirrors the subset of requests.Session.post used by the
+apps, so it can replace the pooled session without changing callers. Each
+response also carries the DNS, connect and time-to-first-byte `timings` of
+its request, traced with aiohttp's request hooks.
+"""
+import asyncio
+import json
+import logging
+import os
+import queue
+import threading
+
+import streamlit as st
+
+try:
+    import aiohttp
+except ImportError:  # Optional dependency
+    aiohttp = None
+
+# Configuration (override through environment variables)
+connection_limit = int(os.getenv("ASYNC_HTTP_LIMIT", "256"))  # Concurrent upstream connections for the whole process
+keepalive_timeout = float(os.getenv("ASYNC_HTTP_KEEPALIVE", "60"))
+
+_END_OF_STREAM = object()
+
+
+class AsyncResponse:
+    """Buffered response with the requests.Response attributes used by the apps."""
+
+    def __init__(self, status_code, headers, content, timings=None):
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+        self.timings = timings or {}
+
+    @property
+    def text(self):
+        return self.content.decode("utf-8", errors="replace")
+
+    def json(self):
+        return json.loads(self.content)
+
+    def iter_lines(self):
+        yield from self.content.splitlines()
+
+    def close(self):
+        pass
+
+
+class AsyncStreamingResponse:
+    """
+    Streaming response whose body is read on the event loop and handed to the
+    calling thread line by line through a queue.
+    """
+
+    def __init__(self, client, response, timings=None):
+        self.client = client
+        self.status_code = response.status
+        self.headers = response.headers
+        self.timings = timings or {}
+        self._response = response
+        self._lines = queue.Queue()
+        self._pump = None
+
+    @property
+    def text(self):
+        return ""
+
+    async def _read_lines(self):
+        try:
+            async for line in self._response.content:
+                self._lines.put(line.rstrip(b"\r\n"))
+        except Exception as e:
+            self._lines.put(e)
+        finally:
+            self._response.release()
+            self._lines.put(_END_OF_STREAM)
+
+    def iter_lines(self):
+        if self._pump is None:
+            self._pump = self.client.submit(self._read_lines())
+        while True:
+            item = self._lines.get()
+            if item is _END_OF_STREAM:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+    def close(self):
+        """Stop reading and drop the connection if the stream was not fully consumed."""
+        if self._pump is not None and not self._pump.done():
+            self._pump.cancel()
+        self.client.loop.call_soon_threadsafe(self._response.close)
+
+
+class AsyncChatClient:
+    """
+    Runs an asyncio event loop in a daemon thread and issues HTTP requests on it.
+    """
+
+    def __init__(self, limit=None):
+        """
+        :param limit: Maximum number of concurrent upstream connections.
+        """
+        if aiohttp is None:
+            raise ImportError("The async backend requires aiohttp (pip install aiohttp)")
+        self.limit = limit or connection_limit
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name="chat-event-loop", daemon=True)
+        self.thread.start()
+        self._session = None
+
+    def submit(self, coro):
+        """
+        Schedules a coroutine on the shared loop.
+        :return: A concurrent.futures.Future for its result.
+        """
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    async def _get_session(self):
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.limit, keepalive_timeout=keepalive_timeout)
+            self._session = aiohttp.ClientSession(connector=connector, trace_configs=[_trace_config()])
+        return self._session
+
+    async def post_async(self, url, headers=None, json=None, data=None, stream=False, timeout=None):
+        """
+        Sends a POST request from inside the event loop.
+        :param timeout: Seconds, or a (connect, read) tuple as accepted by requests.
+        :return: An AsyncResponse, or an AsyncStreamingResponse when stream is True and the call succeeded.
+        """
+        session = await self._get_session()
+        timings = {}
+        response = await session.post(
+            url, headers=headers, json=json, data=data, timeout=_client_timeout(timeout), trace_request_ctx=timings
+        )
+        if stream and response.status == 200:
+            return AsyncStreamingResponse(self, response, timings)
+        try:
+            content = await response.read()
+        finally:
+            response.release()
+        return AsyncResponse(response.status, response.headers, content, timings)
+
+    def post(self, url, headers=None, json=None, data=None, stream=False, timeout=None):
+        """
+        Sends a POST request on the shared loop and waits for the response headers
+        (and the body unless streaming). Same arguments as requests.Session.post.
+        """
+        return self.submit(self.post_async(url, headers=headers, json=json, data=data, stream=stream, timeout=timeout)).result()
+
+    def close(self):
+        """Close the connection pool and stop the event loop."""
+        if self._session is not None:
+            self.submit(self._session.close()).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+
+# Function to check whether the async backend can be used
+def is_available():
+    return aiohttp is not None
+
+
+# Function to convert a requests-style timeout to an aiohttp one
+def _client_timeout(timeout):
+    if timeout is None:
+        return aiohttp.ClientTimeout(total=None)
+    if isinstance(timeout, tuple):
+        connect, read = timeout
+        return aiohttp.ClientTimeout(total=None, sock_connect=connect, sock_read=read)
+    return aiohttp.ClientTimeout(total=None, sock_connect=timeout, sock_read=timeout)
+
+
+# Function to build the hooks timing each request's phases
+def _trace_config():
+    """
+    Fills the dict passed as trace_request_ctx with 'dns' and 'connect' (only when a new
+    connection was opened; connect includes the DNS lookup) and 'ttfb', the time until
+    the response headers arrived.
+    """
+    trace_config = aiohttp.TraceConfig()
+
+    async def on_request_start(session, context, params):
+        context.start = asyncio.get_running_loop().time()
+
+    async def on_dns_resolvehost_start(session, context, params):
+        context.dns_start = asyncio.get_running_loop().time()
+
+    async def on_dns_resolvehost_end(session, context, params):
+        context.trace_request_ctx["dns"] = asyncio.get_running_loop().time() - context.dns_start
+
+    async def on_connection_create_start(session, context, params):
+        context.connect_start = asyncio.get_running_loop().time()
+
+    async def on_connection_create_end(session, context, params):
+        context.trace_request_ctx["connect"] = asyncio.get_running_loop().time() - context.connect_start
+
+    async def on_request_end(session, context, params):
+        context.trace_request_ctx["ttfb"] = asyncio.get_running_loop().time() - context.start
+
+    trace_config.on_request_start.append(on_request_start)
+    trace_config.on_dns_resolvehost_start.append(on_dns_resolvehost_start)
+    trace_config.on_dns_resolvehost_end.append(on_dns_resolvehost_end)
+    trace_config.on_connection_create_start.append(on_connection_create_start)
+    trace_config.on_connection_create_end.append(on_connection_create_end)
+    trace_config.on_request_end.append(on_request_end)
+    return trace_config
+
+
+# Function to get the process-wide async client
+@st.cache_resource(show_spinner=False)
+def get_async_client():
+    """
+    Returns the client shared by all Streamlit sessions in this server process.
+    """
+    logging.info("Starting the shared chat event loop")
+    return AsyncChatClient()
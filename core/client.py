@@ -0,0 +1,384 @@
+"""
+Chat completions client shared by the apps, the benchmark and the batch CLI.
+
+ChatClient owns everything between a message list and the reply text:
+request building, the response cache, provider routing with retries and
+rate limits, streaming, and the context window that fits the history into
+the prompt token budget.
+"""
+import logging
+from concurrent.futures import Future
+
+import streamlit as st
+
+from core.coalesce import InFlight, StreamFanout
+from core.context import ContextWindow, count_tokens
+from core.history import api_messages
+from core.length_policy import LengthPolicy
+from core.metrics import RequestRecord, observe_prefix_reuse, start_metrics_server
+from core.preflight import PreflightError, PromptTooLongError, check_messages, fit_request
+from core.providers import Router
+from core.ratelimit import RateLimitExceeded
+from core.response_cache import get_response_cache, make_key, request_params
+from core.streaming import ChatStream, ReplayStream, truncate_at_stop
+
+AUTHENTICATION_ERROR = "Authentication Error: Invalid API key or insufficient permissions."
+BUSY_ERROR = "An error occurred: the service is busy. Please try again in a moment."
+REQUEST_ERROR = "An error occurred while processing your request."
+UNEXPECTED_ERROR = "An unexpected error occurred while processing your request."
+TOO_LONG_ERROR = "An error occurred: the conversation is too long for the model. Please start a new one or shorten your message."
+INVALID_REQUEST_ERROR = "An error occurred: the request is malformed."
+
+# The only texts the client returns in place of a reply when a request fails
+ERROR_RESPONSES = frozenset((
+    AUTHENTICATION_ERROR, BUSY_ERROR, REQUEST_ERROR, UNEXPECTED_ERROR, TOO_LONG_ERROR, INVALID_REQUEST_ERROR
+))
+
+
+# Function to check if the response is complete
+def is_response_complete(text, finish_reason=None):
+    """
+    Determines if the response is complete. A "length" finish reason means the
+    reply was cut off by max_tokens; ending punctuation is only used as a
+    fallback when the provider reports no finish reason (e.g. cache hits).
+    """
+    if finish_reason:
+        return finish_reason != "length"
+    if not text:
+        return True  # Empty response can be considered complete
+    return text.strip().endswith(('.', '!', '?'))
+
+
+# Function to check if a response is one of the error messages above
+def is_error_response(response):
+    # An exact match: a real reply that merely mentions an error is not one
+    return response in ERROR_RESPONSES
+
+
+# Function to pick the error message for a failed response
+def _error_message(response):
+    if response.status_code == 401:
+        logging.error(f"Authentication Error: HTTP {response.status_code} - {response.text}")
+        return AUTHENTICATION_ERROR
+    if response.status_code == 429:
+        logging.error(f"Rate limited: HTTP {response.status_code} - {response.text}")
+        return BUSY_ERROR
+    logging.error(f"Error occurred: HTTP {response.status_code} - {response.text}")
+    return REQUEST_ERROR
+
+
+# Function to pick the error message for a request rejected before sending
+def _preflight_message(error):
+    logging.warning(f"Request rejected before sending: {error}")
+    return TOO_LONG_ERROR if isinstance(error, PromptTooLongError) else INVALID_REQUEST_ERROR
+
+
+class ChatClient:
+    """
+    Sends chat completions requests for one core.config.ChatSettings.
+    """
+
+    def __init__(self, settings, providers=None):
+        """
+        :param settings: The app's ChatSettings.
+        :param providers: Providers to route between; defaults to settings.build_providers().
+        """
+        self.settings = settings
+        self.providers = providers if providers is not None else settings.build_providers()
+        self.router = Router(
+            self.providers,
+            self._http_client,
+            hedge_after=settings.hedge_after,
+            max_queue_wait=settings.max_queue_wait
+        )
+        # Response cache shared by all sessions (configured through RESPONSE_CACHE_* environment variables)
+        self.response_cache = get_response_cache(
+            settings.semantic_cache_model, self.embed if settings.semantic_cache_model else None
+        )
+        # Reply lengths seen so far, sizing max_tokens when enabled
+        self.length_policy = LengthPolicy(settings.max_tokens) if settings.adaptive_max_tokens else None
+        # Identical requests in flight across all sessions share one upstream call
+        self.in_flight = InFlight() if settings.coalesce_requests else None
+        # Context window keeping each request within the prompt token budget
+        self.context_window = ContextWindow(
+            settings.prompt_token_budget,
+            system_prompt=settings.system_prompt,
+            summarize=self.summarize_turns if settings.summarize_evicted_turns else None,
+            eviction_chunk=settings.eviction_chunk_tokens,
+            on_prefix=observe_prefix_reuse
+        )
+
+    def _http_client(self):
+        """
+        Returns the shared async client when enabled and installed, otherwise the pooled session.
+        Both are imported on first use, so importing the apps stays cheap.
+        """
+        if self.settings.async_backend:
+            from core.async_client import get_async_client, is_available
+
+            if is_available():
+                return get_async_client()
+        from core.http import get_session
+
+        return get_session()
+
+    def embed(self, texts):
+        """
+        Embeds texts with the primary provider, for semantic response caching.
+        :return: One vector per text.
+        """
+        from core.config import PROVIDER_PRESETS
+        from core.http import get_session
+        from core.retry import connect_timeout, read_timeout
+
+        provider = self.providers[0]
+        url = f"{provider.api_base}/embeddings"
+        headers = {
+            "Authorization": f"Bearer {provider.api_key}",
+            "Content-Type": "application/json"
+        }
+        data = {
+            "model": self.settings.semantic_cache_model,
+            "input": texts,
+            "encoding_format": "float"
+        }
+        data.update(PROVIDER_PRESETS.get(provider.name, {}).get("embedding_options", {}))
+        response = get_session().post(url, headers=headers, json=data, timeout=(connect_timeout, read_timeout))
+        response.raise_for_status()
+        return [item["embedding"] for item in response.json()["data"]]
+
+    def build_request(self, conversation_messages, prefill=False):
+        """
+        Builds the provider-independent body of a chat completions request; the
+        router fills in the URL, headers and provider-specific model name.
+        :param conversation_messages: List of messages (conversation history).
+        :param prefill: Whether the last message is a partial assistant turn to continue.
+        :return: JSON body, fitted into the model's context window.
+        :raises PreflightError: If the messages are malformed or the latest turn alone is too long.
+        """
+        settings = self.settings
+        check_messages(conversation_messages)
+        data = {
+            "model": settings.model,
+            "messages": api_messages(conversation_messages),
+            "temperature": settings.temperature,
+            "top_p": settings.top_p,
+            "max_tokens": settings.max_tokens
+        }
+        # Continuations keep the full limit; they only exist because a reply needed more
+        if self.length_policy is not None and not prefill:
+            data["max_tokens"] = self.length_policy.max_tokens(data["messages"])
+        if settings.stop_sequences:
+            data["stop"] = list(settings.stop_sequences)
+        dropped = fit_request(data, settings.context_tokens)
+        if dropped:
+            logging.info(f"Dropped {dropped} messages to fit the {settings.context_tokens} token context window")
+        return data
+
+    def _cached_response(self, data):
+        if self.response_cache is None:
+            return None
+        return self.response_cache.get(data["messages"], request_params(data))
+
+    def _cache_response(self, data, response_text, finish_reason=None):
+        if finish_reason == "length":
+            return  # Truncated replies are continued, not replayed
+        if self.response_cache is not None and response_text:
+            self.response_cache.put(data["messages"], request_params(data), response_text)
+
+    def _observe_length(self, data, completion_tokens, finish_reason):
+        if self.length_policy is not None:
+            self.length_policy.observe(data["messages"], data["max_tokens"], completion_tokens, finish_reason == "length")
+
+    def _coalesce_key(self, data, stream):
+        return ("stream" if stream else "plain", make_key(data["messages"], request_params(data)))
+
+    def generate_response(self, conversation_messages, prefill=False):
+        """
+        Generates a response from the fastest healthy provider.
+        :param conversation_messages: List of messages (conversation history).
+        :param prefill: Whether the last message is a partial assistant turn to continue.
+        :return: Response text and a boolean indicating if the response is complete.
+        """
+        record = RequestRecord(stream=False)
+        try:
+            data = self.build_request(conversation_messages, prefill=prefill)
+            cached = self._cached_response(data)
+            if cached is not None:
+                record.finish("ok", cache_hit=True)
+                return cached, True  # Truncated replies are never cached
+            if self.in_flight is None:
+                return self._post(data, record)
+
+            key = self._coalesce_key(data, stream=False)
+            flight, leader = self.in_flight.join(key, Future)
+            if not leader:
+                response_text, complete = flight.result()
+                record.finish("error" if is_error_response(response_text) else "ok", coalesced=True)
+                return response_text, complete
+            try:
+                result = self._post(data, record)
+                flight.set_result(result)
+                return result
+            except Exception as e:
+                flight.set_exception(e)
+                raise
+            finally:
+                self.in_flight.leave(key, flight)
+        except PreflightError as e:
+            record.finish("rejected")
+            return _preflight_message(e), True
+        except RateLimitExceeded as e:
+            logging.warning(f"Every provider's quota queue is full: {e}")
+            record.finish("error")
+            return BUSY_ERROR, True
+        except Exception:
+            logging.exception("Exception occurred during generate_response")
+            record.finish("exception")
+            return UNEXPECTED_ERROR, True
+
+    def _post(self, data, record):
+        provider, response = self.router.post(data, record=record)
+
+        # Log request and response details (secrets are masked by core.redaction)
+        logging.debug(f"Provider: {provider}")
+        logging.debug(f"Request Body: {data}")
+        logging.debug(f"Response Status Code: {response.status_code}")
+        logging.debug(f"Response Body: {response.text}")
+
+        if response.status_code != 200:
+            record.finish("error")
+            return _error_message(response), True
+        response_json = response.json()
+        response_text = response_json['choices'][0]['message']['content']
+        finish_reason = response_json['choices'][0].get('finish_reason')
+        response_text, stopped = truncate_at_stop(response_text, self.settings.stop_sequences)
+        if stopped:
+            finish_reason = "stop"
+        record.set_usage(response_json.get('usage'), data["messages"], response_text)
+        record.finish("ok")
+        self._observe_length(data, record.completion_tokens, finish_reason)
+        self._cache_response(data, response_text, finish_reason)
+        return response_text, is_response_complete(response_text, finish_reason)
+
+    def generate_response_stream(self, conversation_messages, prefill=False):
+        """
+        Streams a response from the fastest healthy provider.
+        :param conversation_messages: List of messages (conversation history).
+        :param prefill: Whether the last message is a partial assistant turn to continue.
+        :return: A ChatStream yielding text chunks, or an error message if the request failed.
+        """
+        record = RequestRecord(stream=True)
+        try:
+            data = self.build_request(conversation_messages, prefill=prefill)
+            cached = self._cached_response(data)
+            if cached is not None:
+                record.finish("ok", cache_hit=True)
+                return ReplayStream(cached)
+            if self.in_flight is None:
+                return self._open_stream(data, record)
+
+            key = self._coalesce_key(data, stream=True)
+            fanout, leader = self.in_flight.join(key, StreamFanout)
+            if not leader:
+                return self._join_stream(fanout, record)
+            try:
+                result = self._open_stream(data, record)
+            except Exception as e:
+                fanout.fail(BUSY_ERROR if isinstance(e, RateLimitExceeded) else UNEXPECTED_ERROR)
+                self.in_flight.leave(key, fanout)
+                raise
+            if isinstance(result, str):
+                fanout.fail(result)
+                self.in_flight.leave(key, fanout)
+                return result
+            return fanout.start(result, on_done=lambda: self.in_flight.leave(key, fanout))
+        except PreflightError as e:
+            record.finish("rejected")
+            return _preflight_message(e)
+        except RateLimitExceeded as e:
+            logging.warning(f"Every provider's quota queue is full: {e}")
+            record.finish("error")
+            return BUSY_ERROR
+        except Exception:
+            logging.exception("Exception occurred during generate_response_stream")
+            record.finish("exception")
+            return UNEXPECTED_ERROR
+
+    def _open_stream(self, data, record):
+        provider, response = self.router.post(data, stream=True, record=record)
+
+        # Log request details; the body is consumed incrementally by ChatStream
+        logging.debug(f"Provider: {provider}")
+        logging.debug(f"Request Body: {data}")
+        logging.debug(f"Response Status Code: {response.status_code}")
+
+        if response.status_code != 200:
+            record.finish("error")
+            return _error_message(response)
+
+        def on_finish(stream):
+            if stream.first_chunk_at is not None:
+                record.first_token(stream.first_chunk_at)
+            record.set_usage(stream.usage, data["messages"], stream.text)
+            record.finish("interrupted" if stream.error else "ok")
+
+        def on_complete(stream):
+            self._cache_response(data, stream.text, stream.finish_reason)
+            # Runs before on_finish, so the usage is read here rather than from the record
+            completion_tokens = (stream.usage or {}).get("completion_tokens") or count_tokens(stream.text)
+            self._observe_length(data, completion_tokens, stream.finish_reason)
+
+        return ChatStream(response, on_complete=on_complete, on_finish=on_finish, stop=self.settings.stop_sequences)
+
+    def _join_stream(self, fanout, record):
+        """
+        Attaches to an identical stream already in flight, replaying what it produced so far.
+        """
+        result = fanout.wait()
+        if isinstance(result, str):
+            record.finish("error", coalesced=True)
+            return result
+
+        def on_finish(stream):
+            if stream.first_chunk_at is not None:
+                record.first_token(stream.first_chunk_at)
+            record.finish("interrupted" if stream.error else "ok", coalesced=True)
+
+        result.on_finish = on_finish
+        return result
+
+    def summarize_turns(self, previous_summary, evicted_messages):
+        """
+        Folds messages evicted from the context window into the rolling conversation summary.
+        :return: The new summary, or None if it could not be generated.
+        """
+        transcript = "\n".join(f"{msg['role']}: {msg['content']}" for msg in evicted_messages)
+        if previous_summary:
+            transcript = f"Earlier summary: {previous_summary}\n\n{transcript}"
+        response, _ = self.generate_response([
+            {'role': 'system', 'content': "Summarize the conversation below in a few sentences. "
+                                          "Keep facts, names and decisions the user may refer back to."},
+            {'role': 'user', 'content': transcript}
+        ])
+        if is_error_response(response):
+            return None
+        return response
+
+
+# Function to get the process-wide client of an app
+def get_chat_client(settings):
+    """
+    Returns the client shared by all sessions of the app, built once per
+    server process instead of on every rerun.
+    """
+    return _get_chat_client(settings.cache_key(), settings)
+
+
+@st.cache_resource(show_spinner=False)
+def _get_chat_client(settings_key, _settings):
+    start_metrics_server()
+    client = ChatClient(_settings)
+    if _settings.warm_up:
+        client.router.warm_up()
+    return client
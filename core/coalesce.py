@@ -0,0 +1,171 @@
+"""
+Single-flight coalescing of identical in-flight requests.
+
+Requests are keyed like the response cache (normalized messages plus sampling
+parameters). While one is in flight, identical requests attach to it instead
+of calling the upstream: plain requests wait for its result, and streams read
+from a fan-out buffer that replays the chunks already produced to late joiners.
+"""
+import threading
+import time
+
+from core.streaming import ChatStream
+
+
+class InFlight:
+    """
+    Registry of the requests currently being sent, by key, shared by all sessions.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = {}
+
+    def join(self, key, factory):
+        """
+        :param factory: Creates the entry when no identical request is in flight.
+        :return: The entry and whether the caller created it, and so leads the request.
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                return entry, False
+            entry = self.entries[key] = factory()
+            return entry, True
+
+    def leave(self, key, entry):
+        """Removes the entry, so later requests go upstream or to the response cache."""
+        with self.lock:
+            if self.entries.get(key) is entry:
+                del self.entries[key]
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class StreamFanout:
+    """
+    Buffers the chunks of one upstream ChatStream and replays them to any number
+    of readers. The upstream is drained on its own thread, so readers that stop
+    early do not stall the others; it is only closed once every reader has left.
+    """
+
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.upstream = None
+        self.failure = None
+        self.chunks = []
+        self.readers = 0
+        self.started = False
+        self.done = False
+        self.cancelled = False
+
+    def start(self, upstream, on_done=None):
+        """
+        Starts draining the leader's upstream stream.
+        :param on_done: Optional callback run once the upstream ended.
+        :return: The leader's reader.
+        """
+        reader = self.reader()
+        with self.cond:
+            self.upstream = upstream
+            self.started = True
+            self.cond.notify_all()
+        threading.Thread(target=self._pump, args=(on_done,), name="stream-fanout", daemon=True).start()
+        return reader
+
+    def fail(self, message):
+        """Hands the leader's error message to every waiting follower."""
+        with self.cond:
+            self.failure = message
+            self.started = self.done = True
+            self.cond.notify_all()
+
+    def wait(self):
+        """
+        Waits until the leader's request was answered.
+        :return: A new reader, or the leader's error message.
+        """
+        with self.cond:
+            while not self.started:
+                self.cond.wait()
+            if self.failure is not None:
+                return self.failure
+        return self.reader()
+
+    def reader(self):
+        with self.cond:
+            self.readers += 1
+        return FanoutStream(self)
+
+    def detach(self):
+        """Called by a reader that stopped; the last one to leave early cancels the upstream."""
+        with self.cond:
+            self.readers -= 1
+            if self.readers == 0 and not self.done:
+                self.cancelled = True
+
+    def _pump(self, on_done):
+        try:
+            for chunk in self.upstream:
+                with self.cond:
+                    self.chunks.append(chunk)
+                    self.cond.notify_all()
+                    if self.cancelled:
+                        break
+        finally:
+            self.upstream.close()
+            with self.cond:
+                self.done = True
+                self.cond.notify_all()
+            if on_done is not None:
+                on_done()
+
+
+class FanoutStream(ChatStream):
+    """
+    One reader of a StreamFanout: replays the buffered chunks, then follows the
+    live ones. Behaves like the ChatStream it reads from.
+    """
+
+    def __init__(self, fanout, on_finish=None):
+        super().__init__(None, on_finish=on_finish)
+        self.fanout = fanout
+        self.closed = False
+
+    def __iter__(self):
+        fanout = self.fanout
+        index = 0
+        try:
+            while True:
+                with fanout.cond:
+                    while index >= len(fanout.chunks) and not fanout.done:
+                        fanout.cond.wait()
+                    new = fanout.chunks[index:]
+                    finished = fanout.done
+                for chunk in new:
+                    self._append(chunk)
+                    yield chunk
+                index += len(new)
+                if finished:
+                    break
+            upstream = fanout.upstream
+            self.finish_reason = upstream.finish_reason
+            self.usage = upstream.usage
+            self.error = upstream.error
+            if self.error is None and fanout.cancelled:
+                self.error = RuntimeError("The shared stream was cancelled")
+        finally:
+            self.close()
+            if self.on_finish is not None:
+                self.on_finish(self)
+
+    def _append(self, chunk):
+        if self.first_chunk_at is None:
+            self.first_chunk_at = time.monotonic()
+        self.chunks.append(chunk)
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.fanout.detach()
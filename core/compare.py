@@ -0,0 +1,185 @@
+"""
+Side-by-side comparison of model and sampling configurations.
+
+One prompt is sent to every variant at once. Each answer is read on its own
+thread and handed to the page through a shared queue, so the columns fill in
+concurrently and a slow variant does not hold up the others. Latency and
+token counts are recorded per variant.
+"""
+import json
+import queue
+import threading
+import time
+
+import streamlit as st
+
+from core.client import ChatClient, is_error_response
+from core.config import PROVIDER_PRESETS
+from core.context import count_tokens
+from core.rendering import format_markdown
+from core.streaming import ReplayStream
+from core.validation import validate_input
+
+# Variant fields, by the type the request needs (the table editor returns numbers as floats)
+_variant_fields = {"model": str, "temperature": float, "top_p": float, "max_tokens": int}
+
+
+# Function to build the settings of one variant
+def variant_settings(settings, variant):
+    """
+    :param settings: The app's core.config.ChatSettings, providing everything a variant leaves unset.
+    :param variant: Dict with 'provider', 'model', 'temperature', 'top_p' and 'max_tokens'; empty values keep the app's.
+    """
+    overrides = {
+        field: cast(variant[field]) for field, cast in _variant_fields.items()
+        if variant.get(field) not in (None, "") and variant[field] == variant[field]  # Skips NaN from empty cells
+    }
+    if variant.get("provider") and variant["provider"] != settings.primary:
+        overrides["primary"] = variant["provider"]
+        overrides.setdefault("model", None)  # The other provider's preset model
+    # Hedging would mix in another provider's answer and timing
+    return settings.replace(hedge_after=0, **overrides)
+
+
+# Function to describe a variant in a column header
+def variant_label(settings):
+    return f"{settings.primary} · {settings.model.split('/')[-1]} · T={settings.temperature} · top_p={settings.top_p}"
+
+
+class VariantRun:
+    """
+    Streams one variant's answer on a worker thread, putting (index, chunk) on
+    the shared queue and (index, None) once it ended.
+    """
+
+    def __init__(self, index, settings, messages, updates):
+        self.index = index
+        self.settings = settings
+        # Only the variant's own provider answers; failover would compare another model
+        self.client = ChatClient(settings, providers=settings.build_providers()[:1])
+        self.messages = messages
+        self.updates = updates
+        self.text = ""
+        self.result = {"variant": variant_label(settings)}
+
+    def start(self):
+        threading.Thread(target=self._run, name=f"compare-{self.index}", daemon=True).start()
+
+    def _run(self):
+        start = time.monotonic()
+        ttft = None
+        try:
+            stream = self.client.generate_response_stream(self.messages)
+            if isinstance(stream, str):
+                self.text = stream
+                self.updates.put((self.index, stream))
+            else:
+                for chunk in stream:
+                    if ttft is None:
+                        ttft = time.monotonic() - start
+                    self.text += chunk
+                    self.updates.put((self.index, chunk))
+            duration = time.monotonic() - start
+            usage = getattr(stream, "usage", None) or {}
+            completion_tokens = usage.get("completion_tokens") or count_tokens(self.text)
+            generating = duration - (ttft or 0)
+            self.result.update({
+                "ttft_s": round(ttft, 3) if ttft is not None else None,
+                "duration_s": round(duration, 3),
+                "prompt_tokens": usage.get("prompt_tokens"),
+                "completion_tokens": completion_tokens,
+                "tokens_per_s": round(completion_tokens / generating, 1) if generating > 0 else None,
+                "finish_reason": getattr(stream, "finish_reason", None),
+                "cached": isinstance(stream, ReplayStream),
+                "error": is_error_response(self.text) or getattr(stream, "error", None) is not None,
+            })
+        finally:
+            self.updates.put((self.index, None))
+
+
+# Function to run a prompt against every variant and stream the answers into columns
+def compare(settings, variants, messages):
+    """
+    :param variants: List of variant dicts, see variant_settings.
+    :param messages: The conversation to send to each variant.
+    :return: One result dict per variant, with latency and token counts.
+    """
+    updates = queue.Queue()
+    runs = [VariantRun(index, variant_settings(settings, variant), messages, updates)
+            for index, variant in enumerate(variants)]
+    placeholders = []
+    for run, column in zip(runs, st.columns(len(runs))):
+        column.caption(run.result["variant"])
+        placeholders.append(column.empty())
+    for run in runs:
+        run.start()
+
+    # Only the script thread may update the page; it renders chunks in the order they arrive
+    texts = [""] * len(runs)
+    pending = len(runs)
+    while pending:
+        index, chunk = updates.get()
+        if chunk is None:
+            pending -= 1
+            placeholders[index].markdown(format_markdown("**Answer**", texts[index]))
+            continue
+        texts[index] += chunk
+        placeholders[index].markdown(format_markdown("**Answer**", texts[index]) + "▌")
+    return [run.result for run in runs]
+
+
+# Function to run the comparison page of an app
+def run_compare_app(settings):
+    """
+    :param settings: The app's core.config.ChatSettings, used for the first variant and for every unset value.
+    """
+    st.title("Compare models and settings")
+    st.write("Each row is one variant; the prompt is sent to all of them at once.")
+
+    if 'compare_variants' not in st.session_state:
+        st.session_state.compare_variants = [
+            {"provider": settings.primary, "model": settings.model, "temperature": settings.temperature,
+             "top_p": settings.top_p, "max_tokens": settings.max_tokens},
+            {"provider": settings.primary, "model": settings.model, "temperature": 1.0,
+             "top_p": settings.top_p, "max_tokens": settings.max_tokens},
+        ]
+    if 'compare_results' not in st.session_state:
+        st.session_state.compare_results = []
+
+    variants = st.data_editor(
+        st.session_state.compare_variants,
+        num_rows="dynamic",
+        column_config={
+            "provider": st.column_config.SelectboxColumn("provider", options=list(PROVIDER_PRESETS), required=True),
+            "temperature": st.column_config.NumberColumn("temperature", min_value=0.0, max_value=2.0, step=0.1),
+            "top_p": st.column_config.NumberColumn("top_p", min_value=0.0, max_value=1.0, step=0.05),
+            "max_tokens": st.column_config.NumberColumn("max_tokens", min_value=1, step=1),
+        },
+        key="variants_editor",
+    )
+    prompt = st.text_area("Prompt:", key="compare_prompt")
+
+    if st.button("Run") and variants:
+        problem = validate_input(prompt)
+        if problem:
+            st.warning(problem)
+        else:
+            messages = [{'role': 'user', 'content': prompt}]
+            if settings.system_prompt:
+                messages.insert(0, {'role': 'system', 'content': settings.system_prompt})
+            results = compare(settings, variants, messages)
+            for result in results:
+                result["prompt"] = prompt
+            st.session_state.compare_results.extend(results)
+
+    results = st.session_state.compare_results
+    if results:
+        st.write("**Latency and tokens per variant:**")
+        st.dataframe(results, column_order=(
+            "variant", "ttft_s", "duration_s", "prompt_tokens", "completion_tokens",
+            "tokens_per_s", "finish_reason", "cached", "error", "prompt"
+        ))
+        st.download_button(
+            "Download results", "\n".join(json.dumps(result) for result in results),
+            file_name="comparison.jsonl", mime="application/jsonl"
+        )
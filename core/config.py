@@ -0,0 +1,173 @@
+"""
+Configuration shared by the apps: secrets, provider presets and chat settings.
+"""
+import os
+
+import streamlit as st
+
+from core import load_environment  # noqa: F401 (re-exported for the apps; .env is already loaded)
+
+# OpenAI-compatible providers serving the model, by name
+PROVIDER_PRESETS = {
+    "deepinfra": {
+        "api_base": "https://api.deepinfra.com/v1/openai",
+        "api_key_name": "DEEPINFRA_API_KEY",
+        "requires_api_key": True,
+        "model": "nvidia/Llama-3.1-Nemotron-70B-Instruct",
+        "embedding_options": {},
+        "price_per_million_tokens": (0.12, 0.30),  # USD for prompt and completion tokens; check the provider's pricing page
+        "cache_hint": None,  # Prefix caching is automatic; set e.g. "prompt_cache_key" for providers routing on a key
+        # Body fields to continue a final assistant message in place; None asks for the rest in a new turn
+        "continuation_options": None,  # Prefill support is not documented
+    },
+    "nvidia": {
+        "api_base": "https://integrate.api.nvidia.com/v1",
+        "api_key_name": "NVIDIA_API_KEY",
+        "requires_api_key": True,
+        "model": "nvidia/llama-3.1-nemotron-70b-instruct",
+        "embedding_options": {"input_type": "query"},  # Required by NVIDIA's retrieval embedding models
+        "price_per_million_tokens": None,  # Billed in credits rather than per token
+        "cache_hint": None,
+        "continuation_options": None,  # Prefill support is not documented
+    },
+    # A llama.cpp or vLLM server on this machine or network, or a model run in-process
+    "local": {
+        "api_base": os.getenv("LOCAL_API_BASE", "http://127.0.0.1:8080/v1"),  # llama.cpp server's default; vLLM listens on :8000
+        "api_key_name": "LOCAL_API_KEY",  # Only needed if the server was started with an API key
+        "requires_api_key": False,
+        "model": os.getenv("LOCAL_MODEL", "local"),  # llama.cpp answers with its one model whatever the name; vLLM needs the served name
+        "model_path": os.getenv("LOCAL_MODEL_PATH"),  # GGUF file run in-process with llama-cpp-python instead of calling the server
+        "embedding_options": {},
+        "price_per_million_tokens": None,
+        "cache_hint": None,
+        # vLLM needs these to continue the message; llama.cpp's server does so by default and ignores them
+        "continuation_options": {"continue_final_message": True, "add_generation_prompt": False},
+    },
+}
+
+# Deployment-wide override of every app's primary provider, e.g. "local" at sites without internet egress
+provider_override = os.getenv("CHAT_PROVIDER")
+
+
+# Function to read a secret from Streamlit secrets or the environment
+def get_secret(name):
+    """
+    Looks a secret up in .streamlit/secrets.toml, falling back to the environment.
+    Missing secrets files are not an error, so the apps also run from plain env vars.
+    :return: The secret value, or None.
+    """
+    try:
+        value = st.secrets.get(name)
+    except FileNotFoundError:
+        value = None
+    return value or os.getenv(name)
+
+
+class ChatSettings:
+    """
+    Settings of a chat app. The class attributes are the defaults; each app
+    overrides the ones it needs as keyword arguments.
+    """
+
+    model = None  # Primary provider's model name; None uses its preset
+    temperature = 0.5
+    top_p = 1
+    max_tokens = 1024
+    adaptive_max_tokens = False  # Size max_tokens from the reply lengths seen for similar prompts, up to the value above
+    stop_sequences = ()  # Generation ends at any of these strings (sent upstream and enforced client-side)
+    stream_responses = True  # Render tokens as they arrive instead of waiting for the full reply
+    async_backend = True  # Multiplex upstream calls on one shared event loop (needs aiohttp)
+    semantic_cache_model = os.getenv("SEMANTIC_CACHE_MODEL")  # Embedding model for near-duplicate cache hits; unset disables them
+    system_prompt = os.getenv("SYSTEM_PROMPT")  # Pinned at the start of every request; unset sends none
+    context_tokens = 131072  # Model's context window; longer requests lose max_tokens, then history, or are rejected before sending
+    prompt_token_budget = 4096  # Oldest turns are evicted once the prompt would exceed this many tokens
+    eviction_chunk_tokens = 1024  # Evict this far below the budget at once, so the prompt prefix stays cacheable between evictions
+    summarize_evicted_turns = False  # Fold evicted turns into a rolling summary (one extra request per eviction)
+    auto_continue_token_cap = 0  # Keep resuming truncated replies up to this many tokens; 0 waits for "Continue"
+    prefetch_token_budget = 0  # Tokens speculative requests may reserve per session without being used; 0 disables prefetching
+    follow_up_suggestions = 0  # Follow-up prompts suggested after each complete reply (prefetched, within the budget above)
+    coalesce_requests = True  # Identical requests in flight at the same time share one upstream call
+    warm_up = False  # Send a one-token request to every provider when the client is built (loads local models, opens connections)
+    hedge_after = None  # Seconds before a slow request is also sent to the next provider; None uses its p95, 0 disables
+    requests_per_minute = None  # Client-side quota per provider; None disables the limiter
+    tokens_per_minute = None  # Counts prompt tokens plus max_tokens, like most provider quotas
+    max_queue_wait = 30  # Seconds a request may queue for quota before failing over to the next provider
+    history_page_size = 20  # Messages kept in memory when resuming, and loaded per "Load earlier messages" click
+
+    def __init__(self, primary, **overrides):
+        """
+        :param primary: Name of the preferred provider in PROVIDER_PRESETS; CHAT_PROVIDER replaces it.
+        :param overrides: Settings replacing the defaults above.
+        """
+        if provider_override and provider_override != primary:
+            # The app's model name belongs to the provider it was written for
+            primary = provider_override
+            overrides.pop("model", None)
+        if primary not in PROVIDER_PRESETS:
+            raise ValueError(f"Unknown provider {primary!r}")
+        self.primary = primary
+        for name, value in overrides.items():
+            if not hasattr(ChatSettings, name) or callable(getattr(ChatSettings, name)):
+                raise TypeError(f"Unknown setting {name!r}")
+            setattr(self, name, value)
+        if self.model is None:
+            self.model = PROVIDER_PRESETS[primary]["model"]
+
+    def replace(self, **overrides):
+        """
+        :return: A copy of these settings with some of them replaced.
+        """
+        values = dict(vars(self), **overrides)
+        return ChatSettings(values.pop("primary"), **values)
+
+    def cache_key(self):
+        """
+        :return: A string identifying these settings, for caching objects built from them.
+        """
+        return repr(sorted(vars(self).items()))
+
+    @property
+    def api_base(self):
+        return PROVIDER_PRESETS[self.primary]["api_base"]
+
+    @property
+    def api_key_name(self):
+        return PROVIDER_PRESETS[self.primary]["api_key_name"]
+
+    @property
+    def requires_api_key(self):
+        return PROVIDER_PRESETS[self.primary]["requires_api_key"]
+
+    def build_providers(self):
+        """
+        Lists the providers in order of preference: the primary one, then every
+        other preset whose API key is set, for failover and hedging. A preset
+        with a model_path is run in-process, which loads the model.
+        :return: A list of core.providers.Provider.
+        """
+        from core.providers import Provider
+
+        providers = []
+        for name, preset in PROVIDER_PRESETS.items():
+            api_key = get_secret(preset["api_key_name"])
+            if name == self.primary:
+                transport = None
+                continuation_options = preset["continuation_options"]
+                if preset.get("model_path"):
+                    from core.local_model import get_local_model
+
+                    transport = get_local_model(preset["model_path"])
+                    continuation_options = None  # llama-cpp-python's chat templates always open a new turn
+                providers.insert(0, Provider(
+                    name, preset["api_base"], api_key, self.model, self.requests_per_minute,
+                    self.tokens_per_minute, preset["cache_hint"], transport, continuation_options
+                ))
+            elif api_key:
+                providers.append(Provider(
+                    name, preset["api_base"], api_key, preset["model"], self.requests_per_minute,
+                    self.tokens_per_minute, preset["cache_hint"], continuation_options=preset["continuation_options"]
+                ))
+        return providers
+
+    def __repr__(self):
+        return f"ChatSettings({self.primary!r}, model={self.model!r})"
@@ -0,0 +1,203 @@
+"""
+Token-budget-aware context window for chat requests.
+
+Instead of keeping a fixed number of messages, the oldest turns are evicted
+once the prompt would exceed a token budget. The system prompt is pinned, and
+evicted turns can be folded into a rolling summary message.
+
+Eviction frees a whole chunk of tokens at once rather than a turn per request,
+so between evictions every prompt starts with the previous one and providers
+can reuse their cached prefix (KV cache) instead of recomputing the history.
+
+tiktoken downloads its BPE file on first use and caches it in
+TIKTOKEN_CACHE_DIR (default: .cache/tiktoken in the project). For hosts
+without internet access, copy that directory from a machine where the apps
+have run once; without it, token counts are estimated from text length.
+"""
+import functools
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+message_overhead = 4  # Tokens added per message by the chat template (role header and separators)
+token_cache_size = 8192  # Texts whose token count is remembered
+summary_prefix = "Summary of the earlier conversation:\n"
+base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+tiktoken_cache_dir = os.getenv("TIKTOKEN_CACHE_DIR", os.path.join(base_dir, ".cache", "tiktoken"))
+
+
+@functools.lru_cache(maxsize=1)
+def _encoding():
+    # Imported here so apps start without loading the BPE tables
+    try:
+        import tiktoken
+    except ImportError:  # Optional dependency
+        logging.warning("tiktoken is not installed; estimating token counts from text length")
+        return None
+    # tiktoken reads the variable when it loads the file; a persistent directory survives reboots
+    os.environ.setdefault("TIKTOKEN_CACHE_DIR", tiktoken_cache_dir)
+    try:
+        # Llama 3 uses a tiktoken BPE with a superset of this vocabulary, so counts are close
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception:  # The BPE file is downloaded on first use, which fails without internet access
+        # Returning (rather than raising) lets lru_cache remember the fallback instead of retrying
+        logging.warning(
+            f"Could not load the tiktoken encoding (see TIKTOKEN_CACHE_DIR={tiktoken_cache_dir}); "
+            "estimating token counts from text length",
+            exc_info=True,
+        )
+        return None
+
+
+_token_counts = OrderedDict()
+_token_counts_lock = threading.Lock()
+
+
+def _remember_count(text, count):
+    with _token_counts_lock:
+        _token_counts[text] = count
+        _token_counts.move_to_end(text)
+        while len(_token_counts) > token_cache_size:
+            _token_counts.popitem(last=False)
+
+
+def _cached_count(text):
+    with _token_counts_lock:
+        count = _token_counts.get(text)
+        if count is not None:
+            _token_counts.move_to_end(text)
+        return count
+
+
+# Function to count the tokens in a text
+def count_tokens(text, cache=True):
+    """
+    Counts tokens with a local tokenizer, or estimates them when none is installed.
+    Results are cached per text, so history is not re-tokenized on every turn.
+    :param cache: False for callers that keep the count themselves (core.history.Message),
+                  so the cache does not hold a second copy of the text.
+    """
+    if not text:
+        return 0
+    count = _cached_count(text)
+    if count is None:
+        encoding = _encoding()
+        count = max(1, len(text) // 4) if encoding is None else len(encoding.encode(text, disallowed_special=()))
+        if cache:
+            _remember_count(text, count)
+    return count
+
+
+# Function to count the tokens of many texts at once
+def count_tokens_batch(texts):
+    """
+    Like count_tokens for every text, but the uncached ones are tokenized in a
+    single encode_batch call, which tiktoken spreads over threads.
+    :return: One count per text.
+    """
+    missing = list({text for text in texts if text and _cached_count(text) is None})
+    encoding = _encoding()
+    if missing and encoding is not None:
+        for text, tokens in zip(missing, encoding.encode_batch(missing, disallowed_special=())):
+            _remember_count(text, len(tokens))
+    return [count_tokens(text) for text in texts]
+
+
+# Function to count the tokens of a message list
+def count_message_tokens(messages):
+    # core.history.Message records keep their own count; dicts go through the per-text cache
+    return sum(
+        (msg.tokens if hasattr(msg, 'tokens') else count_tokens(msg['content'])) + message_overhead
+        for msg in messages
+    )
+
+
+class ContextWindow:
+    """
+    Keeps the messages of a conversation state within a prompt token budget.
+
+    The conversation state is the dict kept in st.session_state: its
+    'messages' list is trimmed in place and its 'summary' entry holds the
+    rolling summary of evicted turns.
+    """
+
+    def __init__(self, budget, system_prompt=None, summarize=None, eviction_chunk=0, on_prefix=None):
+        """
+        :param budget: Maximum number of prompt tokens per request.
+        :param system_prompt: Optional system prompt pinned at the start of every request.
+        :param summarize: Optional function (previous_summary, evicted_messages) -> summary text.
+        :param eviction_chunk: Tokens freed below the budget whenever turns are evicted; 0 evicts just enough.
+        :param on_prefix: Optional function (reused_tokens, prompt_tokens, extends_previous) called
+            with how much of each prompt repeats the conversation's previous one.
+        """
+        self.budget = budget
+        self.system_prompt = system_prompt
+        self.summarize = summarize
+        self.eviction_chunk = min(eviction_chunk, budget // 2)
+        self.on_prefix = on_prefix
+
+    def _pinned(self, state):
+        pinned = []
+        if self.system_prompt:
+            pinned.append({'role': 'system', 'content': self.system_prompt})
+        if state.get('summary'):
+            pinned.append({'role': 'system', 'content': summary_prefix + state['summary']})
+        return pinned
+
+    def build(self, state):
+        """
+        Evicts the oldest turns until the prompt fits the budget and returns it.
+        The latest message is always kept, even if it exceeds the budget on its own.
+        :param state: The conversation state dict.
+        :return: The list of messages to send.
+        """
+        messages = state['messages']
+        pinned = self._pinned(state)
+        used = count_message_tokens(pinned) + count_message_tokens(messages)
+
+        evict = 0
+        target = self.budget - self.eviction_chunk if used > self.budget else self.budget
+        while used > target and evict < len(messages) - 1:
+            used -= count_message_tokens([messages[evict]])
+            evict += 1
+        # Never start the kept history with an assistant turn whose question was dropped
+        while evict and evict < len(messages) - 1 and messages[evict]['role'] == 'assistant':
+            used -= count_message_tokens([messages[evict]])
+            evict += 1
+
+        if evict:
+            evicted = messages[:evict]
+            del messages[:evict]
+            logging.info(f"Evicted {len(evicted)} messages to stay within {self.budget} prompt tokens")
+            if self.summarize is not None:
+                self._fold_into_summary(state, evicted)
+                pinned = self._pinned(state)
+
+        prompt = pinned + list(messages)
+        if self.on_prefix is not None:
+            self._track_prefix(state, prompt)
+        return prompt
+
+    def _track_prefix(self, state, prompt):
+        """
+        Compares the prompt with the conversation's previous one, message by message.
+        Rebuilding an unchanged prompt (e.g. for a prefetch) is not counted again.
+        """
+        digests = [hash((msg['role'], msg['content'])) for msg in prompt]
+        previous = state.get('prompt_digests') or []
+        shared = 0
+        while shared < min(len(digests), len(previous)) and digests[shared] == previous[shared]:
+            shared += 1
+        state['prompt_digests'] = digests
+        if previous and digests != previous:
+            self.on_prefix(count_message_tokens(prompt[:shared]), count_message_tokens(prompt), shared == len(previous))
+
+    def _fold_into_summary(self, state, evicted):
+        try:
+            summary = self.summarize(state.get('summary'), evicted)
+        except Exception:
+            logging.exception("Exception occurred while summarizing evicted messages")
+            return
+        if summary:
+            state['summary'] = summary
@@ -0,0 +1,204 @@
+"""
+Conversation history: message records and the session's conversation state.
+
+The conversation state is the dict kept in st.session_state.conversation_state
+('conversation_id', 'messages', 'summary', 'last_response_complete', and
+'prompt_digests' once the context window built a prompt); the messages
+themselves are persisted in the conversation store as they are produced.
+
+Messages are Message records rather than dicts: with thousands of idle
+sessions per server, the per-message overhead sets the memory footprint.
+Each record holds its content once, already JSON-encoded, and caches its
+token count, so every turn only measures and escapes the new messages and
+the request body is a join of their fragments (encode_request).
+"""
+import functools
+import json
+import sys
+import uuid
+
+import streamlit as st
+
+from core.context import count_tokens
+
+_message_fields = ('id', 'role', 'content')
+
+
+class Message:
+    """
+    A chat message: slotted, with the role interned, the content stored only
+    as its JSON string literal (decoded when read) and the token count cached
+    until the content changes. It reads and writes like the dict it replaces
+    (msg['content'], msg.get('id')).
+    """
+
+    __slots__ = ('id', '_role', '_content_json', '_tokens')
+
+    def __init__(self, role, content, id=None):
+        self.id = id
+        self._role = sys.intern(role)
+        self.content = content
+
+    @property
+    def role(self):
+        return self._role
+
+    @role.setter
+    def role(self, value):
+        self._role = sys.intern(value)
+
+    @property
+    def content(self):
+        return json.loads(self._content_json)
+
+    @content.setter
+    def content(self, value):
+        # Non-ASCII text stays as is, so it takes no more memory than a plain str
+        self._content_json = json.dumps(value, ensure_ascii=False)
+        self._tokens = None
+
+    @property
+    def tokens(self):
+        """Tokens of the content, without the per-message overhead."""
+        if self._tokens is None:
+            self._tokens = count_tokens(self.content, cache=False)
+        return self._tokens
+
+    @property
+    def fragment(self):
+        """The message as the JSON object sent upstream (role and content only)."""
+        return f'{{"role": {_role_json(self._role)}, "content": {self._content_json}}}'
+
+    def for_request(self):
+        """
+        :return: A copy without the ID, sharing the encoded content and the
+                 token count, so a later edit of this message does not change
+                 a request already built from it.
+        """
+        copy = Message.__new__(Message)
+        copy.id = None
+        copy._role, copy._content_json, copy._tokens = self._role, self._content_json, self.tokens
+        return copy
+
+    def __getitem__(self, key):
+        if key not in _message_fields:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __setitem__(self, key, value):
+        if key not in _message_fields:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def __contains__(self, key):
+        return key in _message_fields
+
+    def get(self, key, default=None):
+        return getattr(self, key) if key in _message_fields else default
+
+    def __repr__(self):
+        return f"Message({self._role!r}, {self.content[:40]!r}, id={self.id!r})"
+
+
+@functools.lru_cache(maxsize=None)
+def _role_json(role):
+    return json.dumps(role)
+
+
+# Function to create a chat message with a stable ID
+def new_message(role, content):
+    return Message(role, content, uuid.uuid4().hex)
+
+
+# Function to strip UI-only fields before a message list is sent upstream
+def api_messages(messages):
+    """
+    :param messages: Message records, or dicts with 'role' and 'content' (batch input, pinned system messages).
+    """
+    return [
+        msg.for_request() if isinstance(msg, Message) else Message(msg['role'], msg['content'])
+        for msg in messages
+    ]
+
+
+# Function to serialize a request body
+def encode_request(body):
+    """
+    :param body: JSON body whose 'messages' may be Message records.
+    :return: The body as UTF-8 JSON; the messages are joined from their pre-encoded fragments.
+    """
+    messages = body.get('messages')
+    if messages is None:
+        return json.dumps(body).encode('utf-8')
+    fields = json.dumps({key: value for key, value in body.items() if key != 'messages'})
+    fragments = ", ".join(
+        msg.fragment if isinstance(msg, Message) else json.dumps({'role': msg['role'], 'content': msg['content']})
+        for msg in messages
+    )
+    separator = ", " if fields != "{}" else ""
+    text = f'{fields[:-1]}{separator}"messages": [{fragments}]}}'
+    try:
+        return text.encode('utf-8')
+    except UnicodeEncodeError:  # A lone surrogate kept unescaped in a fragment
+        return json.dumps(json.loads(text)).encode('utf-8')
+
+
+# Function to create the state of an empty conversation
+def new_conversation_state(conversation_id=None):
+    return {
+        'conversation_id': conversation_id,
+        'messages': [],
+        'summary': None,
+        'last_response_complete': True
+    }
+
+
+# Function to start a new, empty conversation
+def start_new_conversation(store):
+    """
+    Make a new conversation the session's current one. It is only stored with
+    its first message (store_message), so page loads that never send one leave
+    nothing behind.
+    """
+    st.query_params.pop("conversation", None)
+    st.session_state.earlier_messages = []
+    st.session_state.conversation_state = new_conversation_state()
+
+
+# Function to persist a new message of the current conversation
+def store_message(store, message):
+    """Appends the message to the stored conversation, creating it for the first message"""
+    state = st.session_state.conversation_state
+    if state['conversation_id'] is None:
+        state['conversation_id'] = store.create_conversation()
+        st.query_params["conversation"] = state['conversation_id']
+    store.append(state['conversation_id'], message)
+
+
+# Function to resume a stored conversation
+def resume_conversation(store, conversation_id, page_size):
+    """Restore a stored conversation, keeping only its latest page of messages in memory"""
+    state = store.load_state(conversation_id)
+    state['conversation_id'] = conversation_id
+    state['messages'] = store.load_page(conversation_id, limit=page_size)
+    st.session_state.earlier_messages = []
+    st.session_state.conversation_state = state
+
+
+# Function to initialize the session's conversation, resuming the one in the URL
+def init_conversation(store, page_size):
+    if 'conversation_state' in st.session_state:
+        return
+    conversation_id = st.query_params.get("conversation")
+    if conversation_id and store.exists(conversation_id):
+        resume_conversation(store, conversation_id, page_size)
+    else:
+        start_new_conversation(store)
+
+
+# Function to persist the summary and completion flag of the current conversation
+def save_conversation_state(store):
+    state = st.session_state.conversation_state
+    if state['conversation_id'] is None:
+        return  # Nothing stored yet
+    store.save_state(state['conversation_id'], state.get('summary'), state['last_response_complete'])
@@ -0,0 +1,70 @@
+"""
+Process-wide pooled HTTP session shared by every Streamlit session and rerun.
+"""
+import os
+import socket
+
+import requests
+import streamlit as st
+from requests.adapters import HTTPAdapter
+
+# Configuration (override through environment variables)
+pool_connections = int(os.getenv("HTTP_POOL_CONNECTIONS", "4"))  # Number of distinct hosts kept pooled
+pool_maxsize = int(os.getenv("HTTP_POOL_MAXSIZE", "32"))  # Connections kept alive per host
+pool_block = os.getenv("HTTP_POOL_BLOCK", "false").lower() == "true"  # Wait for a free connection instead of opening extra ones
+tcp_keepalive_idle = int(os.getenv("HTTP_TCP_KEEPALIVE_IDLE", "60"))  # Seconds before TCP keep-alive probes start
+
+
+class KeepAliveAdapter(HTTPAdapter):
+    """
+    HTTPAdapter that enables TCP keep-alive probes on pooled sockets, so idle
+    connections survive NAT and load balancer timeouts between chat turns.
+    """
+
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs.setdefault("socket_options", _keepalive_socket_options())
+        super().init_poolmanager(*args, **kwargs)
+
+
+# Function to list the TCP keep-alive options supported by this platform
+def _keepalive_socket_options():
+    from urllib3.connection import HTTPConnection
+
+    options = list(HTTPConnection.default_socket_options)
+    options.append((socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1))
+    if hasattr(socket, "TCP_KEEPIDLE"):
+        options.append((socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, tcp_keepalive_idle))
+    elif hasattr(socket, "TCP_KEEPALIVE"):  # macOS
+        options.append((socket.IPPROTO_TCP, socket.TCP_KEEPALIVE, tcp_keepalive_idle))
+    if hasattr(socket, "TCP_KEEPINTVL"):
+        options.append((socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, 15))
+    return options
+
+
+# Function to build a pooled session
+def create_session(maxsize=None):
+    """
+    Creates a requests session with a keep-alive connection pool.
+    :param maxsize: Connections kept alive per host (defaults to HTTP_POOL_MAXSIZE).
+    :return: A configured requests.Session.
+    """
+    session = requests.Session()
+    adapter = KeepAliveAdapter(
+        pool_connections=pool_connections,
+        pool_maxsize=maxsize or pool_maxsize,
+        pool_block=pool_block,
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers["Connection"] = "keep-alive"
+    return session
+
+
+# Function to get the process-wide session
+@st.cache_resource(show_spinner=False)
+def get_session():
+    """
+    Returns the session shared by all Streamlit sessions in this server process.
+    requests.Session is safe to share across threads for plain request calls.
+    """
+    return create_session()
@@ -0,0 +1,140 @@
+"""
+Cached loading of the remote logo and icons.
+
+Images are kept in memory across reruns and sessions, stored on disk keyed by
+URL and size, revalidated with ETag/Last-Modified, and fall back to the
+bundled images in assets/ when the network is unavailable. Pillow and the
+HTTP session are imported on first use, not when the apps start.
+"""
+import base64
+import hashlib
+import json
+import logging
+import os
+from io import BytesIO
+
+import streamlit as st
+
+# Configuration (override through environment variables)
+base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+assets_dir = os.path.join(base_dir, "assets")
+cache_dir = os.getenv("IMAGE_CACHE_DIR", os.path.join(base_dir, ".cache", "images"))
+revalidate_after = int(os.getenv("IMAGE_REVALIDATE_SECONDS", "3600"))  # How long the in-memory copy is trusted
+request_timeout = float(os.getenv("IMAGE_REQUEST_TIMEOUT", "5"))
+
+
+# Function to compute the on-disk paths of a cached image
+def _cache_paths(url, width):
+    key = hashlib.sha256(f"{url}|{width}".encode("utf-8")).hexdigest()
+    return os.path.join(cache_dir, f"{key}.png"), os.path.join(cache_dir, f"{key}.json")
+
+
+# Function to read an image and its validators from the disk cache
+def _read_disk_cache(url, width):
+    from PIL import Image
+
+    image_path, meta_path = _cache_paths(url, width)
+    try:
+        with open(meta_path, encoding="utf-8") as f:
+            meta = json.load(f)
+        image = Image.open(image_path)
+        image.load()
+        return image, meta
+    except (OSError, ValueError):
+        return None, {}
+
+
+# Function to write an image and its validators to the disk cache
+def _write_disk_cache(url, width, image, meta):
+    image_path, meta_path = _cache_paths(url, width)
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        # Write to temporary files first so concurrent readers never see partial files
+        image.save(image_path + ".tmp", format="PNG")
+        with open(meta_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(image_path + ".tmp", image_path)
+        os.replace(meta_path + ".tmp", meta_path)
+    except OSError as e:
+        logging.warning(f"Could not write image cache for {url}: {e}")
+
+
+# Function to load a bundled fallback image
+def _load_fallback(fallback, width):
+    from PIL import Image
+
+    if not fallback:
+        return None
+    try:
+        image = Image.open(os.path.join(assets_dir, fallback))
+        return image.resize((width, width))
+    except OSError as e:
+        logging.error(f"Error loading fallback image {fallback}: {e}")
+        return None
+
+
+# Function to load images from a URL
+@st.cache_resource(ttl=revalidate_after, show_spinner=False)
+def load_image_from_url(url, width=50, fallback=None):
+    """
+    Loads and resizes an image, downloading it only when the cached copy is stale.
+    :param url: The image URL.
+    :param width: Width and height of the resized image.
+    :param fallback: File name in assets/ used when the image cannot be fetched.
+    :return: A PIL image, or None if neither the image nor a fallback is available.
+    """
+    from PIL import Image
+
+    from core.http import get_session
+
+    cached_image, meta = _read_disk_cache(url, width)
+
+    headers = {}
+    if cached_image is not None:
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+
+    try:
+        response = get_session().get(url, headers=headers, timeout=request_timeout)
+        if response.status_code == 304 and cached_image is not None:
+            return cached_image
+        response.raise_for_status()
+        image = Image.open(BytesIO(response.content))
+        image = image.resize((width, width))
+        _write_disk_cache(url, width, image, {
+            "url": url,
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+        })
+        return image
+    except Exception as e:
+        logging.error(f"Error loading image from {url}: {e}")
+
+    if cached_image is not None:
+        return cached_image
+    return _load_fallback(fallback, width)
+
+
+# Function to get an icon reference the browser can load and cache itself
+@st.cache_resource(ttl=revalidate_after, show_spinner=False)
+def icon_source(url, fallback=None):
+    """
+    Returns the icon's URL when it is reachable, so the browser fetches it once
+    and caches it, instead of the server re-encoding and re-sending a PIL image
+    with every message. Offline, the bundled fallback is inlined as a data URI.
+    :param url: The icon URL.
+    :param fallback: File name in assets/ used when the URL cannot be fetched.
+    :return: A URL or data URI string, or None.
+    """
+    if load_image_from_url(url) is not None:
+        return url
+    if not fallback:
+        return None
+    try:
+        with open(os.path.join(assets_dir, fallback), "rb") as f:
+            return "data:image/png;base64," + base64.b64encode(f.read()).decode("ascii")
+    except OSError as e:
+        logging.error(f"Error loading fallback image {fallback}: {e}")
+        return None
@@ -0,0 +1,82 @@
+"""
+Adaptive max_tokens from the completion lengths observed so far.
+
+Prompts are sorted into a few types (short questions, code, long-form
+writing). For each type, the completion token counts recently reported in
+`usage` give a high percentile, which with some headroom becomes the
+request's max_tokens, so short Q&A no longer reserves a full-length slot.
+The latest reply in the conversation raises the estimate, as follow-ups tend
+to be answered at similar length. Replies cut off by the limit count as
+longer than it, so a tight estimate grows back, and Continue (or
+auto-continue) picks up the rest.
+"""
+import re
+import threading
+from collections import deque
+
+from core.context import count_tokens
+
+# Configuration
+window = 200  # Completions remembered per prompt type
+min_samples = 20  # Completions needed before the estimate replaces the configured max_tokens
+quantile = 0.95
+headroom = 1.25
+min_tokens = 64
+
+_code_pattern = re.compile(r"```|\b(code|function|class|script|implement|refactor|regex|sql|python|javascript)\b", re.IGNORECASE)
+_long_pattern = re.compile(
+    r"\b(write|essay|article|story|report|explain in detail|step by step|detailed|outline|draft|translate)\b",
+    re.IGNORECASE
+)
+
+
+# Function to classify a prompt by the reply length it usually gets
+def prompt_type(messages):
+    """
+    :return: 'code', 'long' or 'short', from the latest user message.
+    """
+    text = next((msg['content'] for msg in reversed(messages) if msg['role'] == 'user'), "")
+    if _code_pattern.search(text):
+        return "code"
+    if _long_pattern.search(text) or count_tokens(text) > 200:
+        return "long"
+    return "short"
+
+
+class LengthPolicy:
+    """
+    Completion lengths per prompt type, shared by the sessions of a client.
+    """
+
+    def __init__(self, ceiling):
+        """
+        :param ceiling: Largest max_tokens ever requested (the configured one).
+        """
+        self.ceiling = ceiling
+        self.lock = threading.Lock()
+        self.samples = {}
+
+    def max_tokens(self, messages):
+        """
+        :return: The max_tokens for a request, rounded up to a power of two so
+                 similar requests keep sharing response cache keys.
+        """
+        with self.lock:
+            samples = sorted(self.samples.get(prompt_type(messages), ()))
+        if len(samples) < min_samples:
+            return self.ceiling
+        needed = samples[min(len(samples) - 1, int(len(samples) * quantile))]
+        last_reply = next((msg['content'] for msg in reversed(messages) if msg['role'] == 'assistant'), "")
+        needed = max(needed, count_tokens(last_reply)) * headroom
+        return min(self.ceiling, max(min_tokens, 1 << (int(needed) - 1).bit_length()))
+
+    def observe(self, messages, max_tokens, completion_tokens, truncated):
+        """
+        Records the length of a reply. Continuations (a prefilled assistant turn) are skipped.
+        :param truncated: Whether the reply was cut off at max_tokens; it then needed more.
+        """
+        if not messages or messages[-1]['role'] == 'assistant' or completion_tokens is None:
+            return
+        length = max(completion_tokens, max_tokens * 2) if truncated else completion_tokens
+        with self.lock:
+            self.samples.setdefault(prompt_type(messages), deque(maxlen=window)).append(length)
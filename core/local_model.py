@@ -0,0 +1,141 @@
+"""
+In-process inference on the CPU with llama.cpp, for sites without internet egress.
+
+LocalModelClient stands in for the HTTP client of a provider: it answers the
+router's POST calls with objects shaped like requests' responses (streams as
+SSE lines), so routing, streaming, caching and metrics work unchanged.
+Requires llama-cpp-python and a GGUF model file (LOCAL_MODEL_PATH).
+"""
+import json
+from json import loads
+import logging
+import os
+import threading
+import time
+
+import streamlit as st
+
+# Configuration (override through environment variables)
+context_size = int(os.getenv("LOCAL_MODEL_CONTEXT", "8192"))  # Must fit the prompt token budget plus max_tokens
+threads = int(os.getenv("LOCAL_MODEL_THREADS", "0")) or None  # 0 lets llama.cpp pick the number of cores
+gpu_layers = int(os.getenv("LOCAL_MODEL_GPU_LAYERS", "0"))  # Layers offloaded to a GPU, if llama.cpp was built with one
+
+# Request fields passed on to llama.cpp; the others (model, stream_options, cache keys) do not apply
+_completion_fields = ("messages", "temperature", "top_p", "max_tokens", "stop", "seed")
+
+
+class LocalResponse:
+    """Buffered response with the requests.Response attributes used by the apps."""
+
+    headers = {}  # No Retry-After; failed requests are retried with the router's backoff
+
+    def __init__(self, status_code, body, timings=None):
+        self.status_code = status_code
+        self.content = json.dumps(body).encode("utf-8")
+        self.timings = timings or {}
+
+    @property
+    def text(self):
+        return self.content.decode("utf-8")
+
+    def json(self):
+        return json.loads(self.content)
+
+    def iter_lines(self):
+        yield from self.content.splitlines()
+
+    def close(self):
+        pass
+
+
+class LocalStreamingResponse:
+    """
+    Streaming response whose chunks are generated as the body is read. The
+    model is held until the stream ends or is closed.
+    """
+
+    status_code = 200
+    headers = {}
+    text = ""
+
+    def __init__(self, first_chunk, chunks, timings=None):
+        self.timings = timings or {}
+        self._first_chunk = first_chunk
+        self._chunks = chunks
+
+    def iter_lines(self):
+        if self._first_chunk is not None:
+            yield b"data: " + json.dumps(self._first_chunk).encode("utf-8")
+        for chunk in self._chunks:
+            yield b"data: " + json.dumps(chunk).encode("utf-8")
+        yield b"data: [DONE]"
+
+    def close(self):
+        self._chunks.close()
+
+
+class LocalModelClient:
+    """
+    Runs chat completions on a llama.cpp model loaded in this process.
+    """
+
+    def __init__(self, model_path):
+        """
+        :param model_path: Path of a GGUF model file.
+        """
+        # Imported here so the apps start without llama.cpp unless a local model is configured
+        from llama_cpp import Llama, LlamaRAMCache
+
+        started = time.monotonic()
+        self.model_path = model_path
+        self.llm = Llama(
+            model_path=model_path, n_ctx=context_size, n_threads=threads, n_gpu_layers=gpu_layers, verbose=False
+        )
+        # Keeps the KV state of recent prompts, so a conversation's history is not re-evaluated every turn
+        self.llm.set_cache(LlamaRAMCache())
+        # llama.cpp contexts are not thread-safe; requests take turns
+        self.lock = threading.Lock()
+        logging.info(f"Loaded local model {model_path} in {time.monotonic() - started:.1f}s")
+
+    def post(self, url, headers=None, json=None, data=None, stream=False, timeout=None):
+        """
+        Same arguments as requests.Session.post; the URL, headers and timeout are ignored.
+        """
+        if json is None:
+            json = loads(data)
+        options = {field: json[field] for field in _completion_fields if field in json}
+        start = time.monotonic()
+        if not stream:
+            try:
+                with self.lock:
+                    result = self.llm.create_chat_completion(**options)
+            except Exception as e:
+                return self._error_response(e)
+            return LocalResponse(200, result, {"ttfb": time.monotonic() - start})
+
+        chunks = self._stream(options)
+        try:
+            # Wait for the first chunk, like an HTTP client waits for the response headers
+            first_chunk = next(chunks, None)
+        except Exception as e:
+            return self._error_response(e)
+        return LocalStreamingResponse(first_chunk, chunks, {"ttfb": time.monotonic() - start})
+
+    def _stream(self, options):
+        with self.lock:
+            yield from self.llm.create_chat_completion(stream=True, **options)
+
+    def _error_response(self, error):
+        logging.exception(f"Local model {self.model_path} failed")
+        # Prompts that do not fit the context are the caller's to fix, not worth a retry
+        status_code = 400 if isinstance(error, ValueError) else 500
+        return LocalResponse(status_code, {"error": {"message": str(error)}})
+
+
+# Function to get the process-wide client of a local model
+@st.cache_resource(show_spinner="Loading the local model...")
+def get_local_model(model_path):
+    """
+    Loads the model once per server process; it is shared by every session.
+    """
+    return LocalModelClient(model_path)
@@ -0,0 +1,390 @@
+"""
+Per-request instrumentation of upstream chat calls.
+
+Every chat request produces a RequestRecord holding its provider, cache
+result (miss, hit, or coalesced onto an identical request in flight), retries, DNS/connect/TTFB/total latency, time to first token and
+token usage. Finished records update process-wide counters and histograms,
+are logged as one JSON line on the "chat.requests" logger and, when
+configured, exported over OpenTelemetry. The metrics are served in the
+Prometheus text format on METRICS_PORT.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import streamlit as st
+
+from core.config import PROVIDER_PRESETS
+from core.context import count_message_tokens, count_tokens
+
+# Configuration (override through environment variables)
+metrics_port = int(os.getenv("METRICS_PORT", "0"))  # Port of the Prometheus endpoint; 0 disables it
+metrics_host = os.getenv("METRICS_HOST", "127.0.0.1")
+otlp_endpoint = os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT")  # Enables the OpenTelemetry exporter (needs opentelemetry-sdk)
+
+latency_buckets = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+phase_buckets = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+request_log = logging.getLogger("chat.requests")
+
+_registry = []
+
+
+# Function to format a sample value the way Prometheus expects
+def _format_value(value):
+    if isinstance(value, float) and value.is_integer():
+        return repr(value)
+    return str(value)
+
+
+# Function to escape a label value
+def _escape(value):
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class Counter:
+    """
+    Monotonic counter with labels.
+    """
+
+    kind = "counter"
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.lock = threading.Lock()
+        self.values = {} if self.labels or self.kind != "counter" else {(): 0}
+        _registry.append(self)
+
+    def _key(self, labels):
+        return tuple(str(labels.get(label, "")) for label in self.labels)
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self):
+        """
+        :return: (name, label pairs, value) tuples in the exposition format.
+        """
+        with self.lock:
+            return [(self.name, tuple(zip(self.labels, key)), value) for key, value in self.values.items()]
+
+
+class Histogram(Counter):
+    """
+    Histogram with labels and cumulative buckets, as Prometheus expects them.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labels=(), buckets=latency_buckets):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self.lock:
+            counts, total, count = self.values.get(key) or ([0] * len(self.buckets), 0.0, 0)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self.values[key] = (counts, total + value, count + 1)
+
+    def samples(self):
+        samples = []
+        with self.lock:
+            for key, (counts, total, count) in self.values.items():
+                labels = tuple(zip(self.labels, key))
+                for bound, bucket_count in zip(self.buckets, counts):
+                    samples.append((f"{self.name}_bucket", labels + (("le", str(float(bound))),), bucket_count))
+                samples.append((f"{self.name}_bucket", labels + (("le", "+Inf"),), count))
+                samples.append((f"{self.name}_sum", labels, total))
+                samples.append((f"{self.name}_count", labels, count))
+        return samples
+
+
+requests_total = Counter(
+    "llm_requests_total", "Chat requests by provider, outcome and cache result",
+    ("provider", "outcome", "cache", "stream")
+)
+request_duration = Histogram(
+    "llm_request_duration_seconds", "Time from request to the end of the response", ("provider", "stream")
+)
+time_to_first_token = Histogram(
+    "llm_time_to_first_token_seconds", "Time from request to the first streamed token", ("provider",)
+)
+upstream_phase = Histogram(
+    "llm_upstream_phase_seconds", "DNS lookup, connect and time to first byte of upstream HTTP calls",
+    ("provider", "phase"), buckets=phase_buckets
+)
+upstream_attempts = Counter(
+    "llm_upstream_attempts_total", "Upstream HTTP calls by provider and status", ("provider", "status")
+)
+retries_total = Counter("llm_retries_total", "Backoff retries after every provider failed")
+hedges_total = Counter("llm_hedges_total", "Requests hedged on another provider", ("provider",))
+tokens_total = Counter("llm_tokens_total", "Prompt, completion and provider-cached prompt tokens", ("provider", "kind"))
+cost_total = Counter("llm_cost_usd_total", "Spend estimated from token usage and provider prices", ("provider",))
+prefix_requests = Counter(
+    "llm_prompt_prefix_requests_total",
+    "Prompts by whether they start with the conversation's previous prompt (full), part of it or none of it",
+    ("reuse",)
+)
+prefix_tokens = Counter(
+    "llm_prompt_prefix_tokens_total", "Prompt tokens repeating the previous prompt's prefix, and new ones", ("kind",)
+)
+
+
+# Function to render every metric in the Prometheus text format
+def render_prometheus():
+    lines = []
+    for metric in _registry:
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        for name, labels, value in metric.samples():
+            if labels:
+                label_text = ",".join(f'{label}="{_escape(value)}"' for label, value in labels)
+                name = f"{name}{{{label_text}}}"
+            lines.append(f"{name} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+
+# Function to get the phase timings of an upstream response
+def response_timings(response):
+    """
+    :return: Seconds spent per phase ('dns', 'connect', 'ttfb'). The async client
+             traces all three; requests only reports the time to the response headers.
+    """
+    timings = getattr(response, "timings", None)
+    if timings is not None:
+        return timings
+    elapsed = getattr(response, "elapsed", None)
+    return {"ttfb": elapsed.total_seconds()} if elapsed is not None else {}
+
+
+# Function to record one upstream HTTP call
+def observe_attempt(provider, status, timings=None):
+    upstream_attempts.inc(provider=provider, status=status)
+    for phase, seconds in (timings or {}).items():
+        upstream_phase.observe(seconds, provider=provider, phase=phase)
+
+
+# Function to record how much of a prompt repeats the conversation's previous one
+def observe_prefix_reuse(reused_tokens, prompt_tokens, extends_previous):
+    """
+    Passed to core.context.ContextWindow as on_prefix.
+    """
+    reuse = "full" if extends_previous else "partial" if reused_tokens else "none"
+    prefix_requests.inc(reuse=reuse)
+    prefix_tokens.inc(reused_tokens, kind="reused")
+    prefix_tokens.inc(prompt_tokens - reused_tokens, kind="new")
+
+
+# Function to estimate the cost of a request from its provider's prices
+def estimate_cost(provider, prompt_tokens, completion_tokens):
+    prices = PROVIDER_PRESETS.get(provider, {}).get("price_per_million_tokens")
+    if not prices:
+        return None
+    return ((prompt_tokens or 0) * prices[0] + (completion_tokens or 0) * prices[1]) / 1e6
+
+
+class RequestRecord:
+    """
+    Measurements of one chat request, filled in as it progresses.
+    """
+
+    def __init__(self, stream=False):
+        self.stream = stream
+        self.start = time.monotonic()
+        self.start_time_ns = time.time_ns()
+        self.provider = None
+        self.cache = "miss"
+        self.status = None
+        self.retries = 0
+        self.timings = {}
+        self.ttft = None
+        self.prompt_tokens = None
+        self.completion_tokens = None
+        self.cached_tokens = None
+        self.usage_estimated = False
+        self.finished = False
+
+    def set_usage(self, usage, messages, text):
+        """
+        Takes token counts from the provider's `usage`, estimating them locally when it sent none.
+        """
+        if usage:
+            self.prompt_tokens = usage.get("prompt_tokens")
+            self.completion_tokens = usage.get("completion_tokens")
+            # Prompt tokens served from the provider's prefix cache, when it reports them
+            self.cached_tokens = (usage.get("prompt_tokens_details") or {}).get("cached_tokens")
+        else:
+            self.prompt_tokens = count_message_tokens(messages)
+            self.completion_tokens = count_tokens(text)
+            self.usage_estimated = True
+
+    def first_token(self, at):
+        """:param at: time.monotonic() of the first streamed token."""
+        if self.ttft is None:
+            self.ttft = at - self.start
+
+    def finish(self, outcome, cache_hit=False, coalesced=False):
+        """
+        Updates the metrics, logs the record and exports it. Only the first call counts.
+        :param outcome: 'ok', 'error' (error response), 'interrupted' (broken stream), 'rejected'
+            (failed the pre-flight checks) or 'exception'.
+        :param coalesced: Whether the response was shared with an identical request in flight,
+            whose own record counts the provider, tokens and cost.
+        """
+        if self.finished:
+            return
+        self.finished = True
+        duration = time.monotonic() - self.start
+        if cache_hit:
+            self.cache, self.provider = "hit", "cache"
+        elif coalesced:
+            self.cache, self.provider = "coalesced", "coalesced"
+        provider = self.provider or "none"
+        stream = str(self.stream).lower()
+        cost = estimate_cost(provider, self.prompt_tokens, self.completion_tokens)
+
+        requests_total.inc(provider=provider, outcome=outcome, cache=self.cache, stream=stream)
+        request_duration.observe(duration, provider=provider, stream=stream)
+        if self.ttft is not None:
+            time_to_first_token.observe(self.ttft, provider=provider)
+        if self.prompt_tokens:
+            tokens_total.inc(self.prompt_tokens, provider=provider, kind="prompt")
+        if self.completion_tokens:
+            tokens_total.inc(self.completion_tokens, provider=provider, kind="completion")
+        if self.cached_tokens:
+            tokens_total.inc(self.cached_tokens, provider=provider, kind="cached")
+        if cost:
+            cost_total.inc(cost, provider=provider)
+
+        fields = {
+            "provider": provider,
+            "outcome": outcome,
+            "status": self.status,
+            "cache": self.cache,
+            "stream": self.stream,
+            "retries": self.retries,
+            "duration_s": round(duration, 4),
+            "ttft_s": round(self.ttft, 4) if self.ttft is not None else None,
+            **{f"{phase}_s": round(seconds, 4) for phase, seconds in self.timings.items()},
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "cached_tokens": self.cached_tokens,
+            "usage_estimated": self.usage_estimated,
+            "cost_usd": round(cost, 6) if cost is not None else None,
+        }
+        request_log.info(json.dumps(fields))
+
+        exporter = get_otel_exporter() if otlp_endpoint else None
+        if exporter is not None:
+            exporter.export(self, fields, duration)
+
+
+class OTelExporter:
+    """
+    Mirrors finished requests to OpenTelemetry as metrics and one span each,
+    exported over OTLP/HTTP to OTEL_EXPORTER_OTLP_ENDPOINT.
+    """
+
+    def __init__(self):
+        from opentelemetry.exporter.otlp.proto.http.metric_exporter import OTLPMetricExporter
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        from opentelemetry.sdk.metrics import MeterProvider
+        from opentelemetry.sdk.metrics.export import PeriodicExportingMetricReader
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor
+
+        # Service name and other attributes come from OTEL_SERVICE_NAME / OTEL_RESOURCE_ATTRIBUTES
+        resource = Resource.create({})
+        meter_provider = MeterProvider(resource=resource, metric_readers=[PeriodicExportingMetricReader(OTLPMetricExporter())])
+        tracer_provider = TracerProvider(resource=resource)
+        tracer_provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+
+        meter = meter_provider.get_meter("chat")
+        self.tracer = tracer_provider.get_tracer("chat")
+        self.requests = meter.create_counter("llm.requests", description=requests_total.documentation)
+        self.duration = meter.create_histogram("llm.request.duration", unit="s", description=request_duration.documentation)
+        self.ttft = meter.create_histogram("llm.time_to_first_token", unit="s", description=time_to_first_token.documentation)
+        self.tokens = meter.create_counter("llm.tokens", description=tokens_total.documentation)
+        self.cost = meter.create_counter("llm.cost", unit="USD", description=cost_total.documentation)
+
+    def export(self, record, fields, duration):
+        attributes = {"provider": fields["provider"], "stream": record.stream}
+        self.requests.add(1, dict(attributes, outcome=fields["outcome"], cache=record.cache))
+        self.duration.record(duration, attributes)
+        if record.ttft is not None:
+            self.ttft.record(record.ttft, attributes)
+        if record.prompt_tokens:
+            self.tokens.add(record.prompt_tokens, dict(attributes, kind="prompt"))
+        if record.completion_tokens:
+            self.tokens.add(record.completion_tokens, dict(attributes, kind="completion"))
+        if fields["cost_usd"]:
+            self.cost.add(fields["cost_usd"], attributes)
+
+        span = self.tracer.start_span("chat.completion", start_time=record.start_time_ns)
+        for key, value in fields.items():
+            if value is not None:
+                span.set_attribute(f"llm.{key}", value)
+        span.end(end_time=record.start_time_ns + int(duration * 1e9))
+
+
+# Function to get the process-wide OpenTelemetry exporter
+@st.cache_resource(show_spinner=False)
+def get_otel_exporter():
+    """
+    :return: The exporter, or None when the OpenTelemetry SDK or OTLP exporter is not installed.
+    """
+    try:
+        exporter = OTelExporter()
+    except ImportError:
+        logging.warning("OTEL_EXPORTER_OTLP_ENDPOINT is set but opentelemetry-sdk and "
+                        "opentelemetry-exporter-otlp-proto-http are not installed")
+        return None
+    logging.info(f"Exporting request metrics and spans to {otlp_endpoint}")
+    return exporter
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # Scrapes would otherwise flood stderr
+
+
+# Function to start the process-wide Prometheus endpoint
+@st.cache_resource(show_spinner=False)
+def start_metrics_server(port=metrics_port, host=metrics_host):
+    """
+    Serves /metrics on a daemon thread, next to the Streamlit server.
+    :return: The server, or None when it is disabled or the port is taken.
+    """
+    if not port:
+        return None
+    try:
+        server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    except OSError as e:
+        logging.warning(f"Could not serve metrics on {host}:{port}: {e}")
+        return None
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    logging.info(f"Serving Prometheus metrics on http://{host}:{port}/metrics")
+    return server
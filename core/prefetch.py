@@ -0,0 +1,150 @@
+"""
+Speculative prefetching of the requests a user is likely to make next.
+
+When a reply was cut off, the user almost always clicks "Continue", so the
+continuation is requested in the background as soon as the truncation is
+detected and the click reads a response that is already under way. After a
+complete reply, follow-up prompts can be suggested the same way, with their
+answers prefetched while the user reads.
+
+Every speculative request reserves max_tokens of the session's budget until
+its result is used. Cancelled and unused requests keep their reservation, so
+the budget bounds what speculation may waste.
+"""
+import logging
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+import streamlit as st
+
+from core.client import is_error_response
+from core.coalesce import StreamFanout
+from core.response_cache import make_key
+from core.streaming import ChatStream
+from core.validation import validate_input
+
+suggestion_prompt = (
+    "Suggest {count} short follow-up questions I might ask next about this conversation. "
+    "Reply with one question per line and nothing else."
+)
+
+_list_marker = re.compile(r"^\s*(?:[-*•]|\d+[.)])\s*")
+
+
+# Function to get the worker threads shared by all sessions' prefetchers
+@st.cache_resource
+def _get_executor():
+    return ThreadPoolExecutor(max_workers=4, thread_name_prefix="prefetch")
+
+
+# Function to discard the result of a speculative request nobody will read
+def _discard(future):
+    if not future.cancelled() and isinstance(future.result(), ChatStream):
+        future.result().close()  # The last reader leaving cancels the upstream stream
+
+
+class Prefetcher:
+    """
+    Speculative requests of one session, keyed like the response cache.
+    Only used from the session's script thread; the requests run on shared workers.
+    """
+
+    def __init__(self, client, token_budget):
+        """
+        :param client: The app's core.client.ChatClient.
+        :param token_budget: Completion tokens speculative requests may reserve without being used.
+        """
+        self.client = client
+        self.token_budget = token_budget
+        self.reserved = 0
+        self.pending = {}
+        self.suggestions = None  # Future of the follow-up prompts for the latest reply
+        self.suggestions_reserved = False
+
+    def _key(self, conversation_messages, prefill):
+        return make_key(conversation_messages, {"prefill": prefill})
+
+    def _reserve(self):
+        cost = self.client.settings.max_tokens
+        if self.reserved + cost > self.token_budget:
+            logging.info(f"Prefetch budget of {self.token_budget} tokens exhausted; skipping speculative request")
+            return False
+        self.reserved += cost
+        return True
+
+    def _release(self):
+        self.reserved -= self.client.settings.max_tokens
+
+    def prefetch(self, conversation_messages, prefill=False):
+        """
+        Starts generating the reply to these messages in the background, if the budget allows.
+        :param prefill: Whether the last message is a partial assistant turn to continue.
+        """
+        key = self._key(conversation_messages, prefill)
+        if key in self.pending or not self._reserve():
+            return
+        self.pending[key] = _get_executor().submit(self._generate, list(conversation_messages), prefill)
+
+    def _generate(self, conversation_messages, prefill):
+        client = self.client
+        if not client.settings.stream_responses:
+            return client.generate_response(conversation_messages, prefill=prefill)
+        result = client.generate_response_stream(conversation_messages, prefill=prefill)
+        if isinstance(result, ChatStream):
+            # Drain the stream now, buffering the chunks until the user asks for them
+            return StreamFanout().start(result)
+        return result
+
+    def take(self, conversation_messages, prefill=False):
+        """
+        Hands over the prefetched reply to exactly these messages and cancels every
+        other speculative request, which the new request made stale.
+        :return: What generate_response or generate_response_stream would have returned, or None.
+        """
+        future = self.pending.pop(self._key(conversation_messages, prefill), None)
+        self.cancel()
+        if future is None:
+            return None
+        self._release()
+        return future.result()
+
+    def cancel(self):
+        """Cancels the pending speculative requests, closing the streams already under way."""
+        for future in self.pending.values():
+            if not future.cancel():
+                future.add_done_callback(_discard)
+        self.pending.clear()
+        if self.suggestions is not None:
+            self.suggestions.cancel()
+            self.suggestions = None
+
+    def suggest(self, conversation_messages, count):
+        """
+        Starts generating follow-up prompts for the conversation, if the budget allows.
+        :param count: Number of prompts to ask for.
+        """
+        if self.suggestions is not None or not self._reserve():
+            return
+        messages = list(conversation_messages) + [
+            {'role': 'user', 'content': suggestion_prompt.format(count=count)}
+        ]
+        self.suggestions = _get_executor().submit(self._suggest, messages, count)
+        self.suggestions_reserved = True
+
+    def _suggest(self, messages, count):
+        response, _ = self.client.generate_response(messages)
+        if is_error_response(response):
+            return []
+        lines = (_list_marker.sub("", line).strip() for line in response.splitlines())
+        return [line for line in lines if line and validate_input(line) is None][:count]
+
+    def ready_suggestions(self):
+        """
+        :return: The follow-up prompts once they were generated, otherwise an empty list.
+        """
+        if self.suggestions is None or not self.suggestions.done():
+            return []
+        if self.suggestions_reserved:
+            self._release()
+            self.suggestions_reserved = False
+        return self.suggestions.result()
@@ -0,0 +1,78 @@
+"""
+Pre-flight checks of a chat request, run locally before it is sent.
+
+A malformed message list or a prompt that cannot fit the model's context
+window would otherwise only show up as an upstream 400 after a full round
+trip (and a retry on the next provider). The prompt is measured with the
+local tokenizer; token counts are cached per message text (core.context), so
+the history is not re-tokenized on every turn.
+"""
+from core.context import count_message_tokens
+from core.history import Message
+
+# Configuration
+roles = ("system", "user", "assistant")
+min_reply_tokens = 256  # Smallest max_tokens a request is shrunk to before history is dropped instead
+
+
+class PreflightError(ValueError):
+    """A request that cannot be sent as it is."""
+
+
+class PromptTooLongError(PreflightError):
+    """A latest turn that does not fit the context window, even without history."""
+
+
+# Function to check the schema of a message list
+def check_messages(messages):
+    """
+    :raises PreflightError: If the list is empty or a message lacks a known role or text content.
+    """
+    if not messages:
+        raise PreflightError("The request has no messages.")
+    for index, msg in enumerate(messages):
+        if not isinstance(msg, (dict, Message)):
+            raise PreflightError(f"Message {index} is not an object.")
+        if msg.get('role') not in roles:
+            raise PreflightError(f"Message {index} has an unknown role {msg.get('role')!r}.")
+        if not isinstance(msg.get('content'), str):
+            raise PreflightError(f"Message {index} has no text content.")
+
+
+# Function to fit a request into the model's context window
+def fit_request(data, context_tokens):
+    """
+    Makes the prompt plus max_tokens fit the context window: max_tokens is
+    lowered first (down to min_reply_tokens), then the oldest turns before
+    the latest user message are dropped. System messages are kept.
+    :param data: Request body from ChatClient.build_request; changed in place.
+    :param context_tokens: Context window of the model, in tokens.
+    :return: The number of messages dropped.
+    :raises PromptTooLongError: If even the latest turn does not fit.
+    """
+    messages = data["messages"]
+    prompt_tokens = count_message_tokens(messages)
+    room = context_tokens - prompt_tokens
+    if room >= data["max_tokens"]:
+        return 0
+    if room >= min(min_reply_tokens, data["max_tokens"]):
+        data["max_tokens"] = room
+        return 0
+
+    # The latest user message and anything after it (a prefilled reply) are never dropped
+    latest = max((index for index, msg in enumerate(messages) if msg['role'] == 'user'), default=len(messages) - 1)
+    needed = min(min_reply_tokens, data["max_tokens"]) - room
+    kept, dropped = [], 0
+    for index, msg in enumerate(messages):
+        if needed > 0 and index < latest and msg['role'] != 'system':
+            needed -= count_message_tokens([msg])
+            dropped += 1
+        else:
+            kept.append(msg)
+    if needed > 0:
+        raise PromptTooLongError(
+            f"The prompt needs {prompt_tokens} tokens, more than the {context_tokens} token context window allows."
+        )
+    data["messages"] = kept
+    data["max_tokens"] = min(data["max_tokens"], context_tokens - count_message_tokens(kept))
+    return dropped
@@ -0,0 +1,383 @@
+"""
+Provider abstraction and latency-aware routing between OpenAI-compatible
+backends (DeepInfra, NVIDIA's integrate API, ...).
+
+The router keeps rolling latency and error statistics per provider, sends each
+request to the fastest healthy provider, hedges slow requests on the next one
+and fails over on 5xx/429 responses and connection errors.
+"""
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import streamlit as st
+
+from core import metrics
+from core.context import count_message_tokens
+from core.history import encode_request
+from core.ratelimit import RateLimitExceeded, get_rate_limiter
+from core.retry import RetryPolicy, connect_timeout, read_timeout, retry_after_seconds
+
+# Configuration (override through environment variables)
+stats_window = int(os.getenv("ROUTER_STATS_WINDOW", "100"))  # Requests remembered per provider
+min_samples = int(os.getenv("ROUTER_MIN_SAMPLES", "5"))  # Samples needed before latency and error rate are trusted
+max_error_rate = float(os.getenv("ROUTER_MAX_ERROR_RATE", "0.5"))
+cooldown_seconds = float(os.getenv("ROUTER_COOLDOWN", "30"))  # Provider is skipped this long after consecutive failures
+cooldown_failures = int(os.getenv("ROUTER_COOLDOWN_FAILURES", "3"))
+
+RETRYABLE_STATUS = (429, 500, 502, 503, 504)
+
+# Sent after a partial reply to providers that cannot continue a final assistant message in place
+continuation_prompt = (
+    "Continue your last reply exactly where it stopped, without repeating any of it or adding an introduction."
+)
+
+
+# Function to compute a key of a prompt's stable prefix
+def prefix_key(messages):
+    """
+    Hashes the pinned system messages and the first turn. They only change when
+    the context window evicts turns, so a conversation's requests share the key.
+    """
+    first_turn = next((index for index, msg in enumerate(messages) if msg['role'] != 'system'), len(messages))
+    prefix = {'messages': messages[:first_turn + 1]}
+    return hashlib.sha256(encode_request(prefix)).hexdigest()[:32]
+
+
+class Provider:
+    """
+    An OpenAI-compatible chat completions endpoint.
+    """
+
+    def __init__(self, name, api_base, api_key, model, requests_per_minute=None, tokens_per_minute=None,
+                 cache_hint=None, transport=None, continuation_options=None):
+        """
+        :param name: Short name used for statistics and logs.
+        :param api_base: Base URL ending in the API version, e.g. https://integrate.api.nvidia.com/v1.
+        :param api_key: Bearer token; None for servers without authentication.
+        :param model: This provider's name for the model.
+        :param requests_per_minute: Client-side request quota; None disables it.
+        :param tokens_per_minute: Client-side token quota (prompt plus max_tokens); None disables it.
+        :param cache_hint: Body field carrying a key of the prompt's stable prefix, for providers
+            that route requests to their prefix cache by it (e.g. "prompt_cache_key").
+        :param transport: Client with a requests-like post() used instead of the shared HTTP
+            client, e.g. a core.local_model.LocalModelClient running the model in-process.
+        :param continuation_options: Body fields making the provider continue a final assistant
+            message rather than start a new turn ({} if it does so by default); None if it cannot,
+            in which case a user message asking to continue is sent after the partial reply.
+        """
+        self.name = name
+        self.api_base = api_base
+        self.api_key = api_key
+        self.model = model
+        self.cache_hint = cache_hint
+        self.transport = transport
+        self.continuation_options = continuation_options
+        self.stats = get_provider_stats(name)
+        self.limiter = get_rate_limiter(name, requests_per_minute, tokens_per_minute)
+
+    def build_request(self, data, stream=False):
+        """
+        Fills in the provider-specific URL, headers and model of a request body.
+        :return: URL, headers and JSON body.
+        """
+        url = f"{self.api_base}/chat/completions"
+        headers = {"Content-Type": "application/json"}
+        if self.api_key:
+            headers["Authorization"] = f"Bearer {self.api_key}"
+        data = dict(data, model=self.model)
+        if data["messages"] and data["messages"][-1]['role'] == 'assistant':  # A partial reply to continue
+            if self.continuation_options is not None:
+                data.update(self.continuation_options)
+            else:
+                data["messages"] = data["messages"] + [{'role': 'user', 'content': continuation_prompt}]
+        if self.cache_hint:
+            data[self.cache_hint] = prefix_key(data["messages"])
+        if stream:
+            headers["Accept"] = "text/event-stream"
+            data["stream"] = True
+            data["stream_options"] = {"include_usage": True}  # Final event carries the token usage
+        return url, headers, data
+
+    def __repr__(self):
+        return f"Provider({self.name!r})"
+
+
+class ProviderStats:
+    """
+    Rolling latency and error statistics for one provider, shared across sessions.
+    """
+
+    def __init__(self, window=stats_window):
+        self.lock = threading.Lock()
+        self.latencies = deque(maxlen=window)
+        self.outcomes = deque(maxlen=window)
+        self.consecutive_failures = 0
+        self.cooldown_until = 0.0
+
+    def record(self, latency, ok):
+        with self.lock:
+            self.outcomes.append(ok)
+            if ok:
+                self.latencies.append(latency)
+                self.consecutive_failures = 0
+            else:
+                self.consecutive_failures += 1
+                if self.consecutive_failures >= cooldown_failures:
+                    self.cooldown_until = time.monotonic() + cooldown_seconds
+
+    def percentile(self, q):
+        """
+        :param q: Percentile between 0 and 100.
+        :return: Latency in seconds, or None without enough samples.
+        """
+        with self.lock:
+            values = sorted(self.latencies)
+        if len(values) < min_samples:
+            return None
+        return values[min(len(values) - 1, int(len(values) * q / 100))]
+
+    @property
+    def p50(self):
+        return self.percentile(50)
+
+    @property
+    def p95(self):
+        return self.percentile(95)
+
+    @property
+    def error_rate(self):
+        with self.lock:
+            if len(self.outcomes) < min_samples:
+                return 0.0
+            return 1 - sum(self.outcomes) / len(self.outcomes)
+
+    @property
+    def healthy(self):
+        return time.monotonic() >= self.cooldown_until and self.error_rate <= max_error_rate
+
+
+# Function to get the process-wide statistics of a provider
+@st.cache_resource(show_spinner=False)
+def get_provider_stats(name):
+    return ProviderStats()
+
+
+# Function to get the thread pool used for hedged requests
+@st.cache_resource(show_spinner=False)
+def _get_executor():
+    return ThreadPoolExecutor(max_workers=int(os.getenv("ROUTER_MAX_WORKERS", "64")), thread_name_prefix="router")
+
+
+class Router:
+    """
+    Sends chat completions requests to the fastest healthy provider.
+    """
+
+    def __init__(self, providers, client, hedge_after=None, retry=None, timeout=None, max_queue_wait=None):
+        """
+        :param providers: Providers in order of preference.
+        :param client: Function returning the HTTP client (requests.Session or AsyncChatClient).
+        :param hedge_after: Seconds to wait before hedging on the next provider; None uses the
+                            primary's p95 latency, 0 disables hedging.
+        :param retry: RetryPolicy applied once every provider has failed.
+        :param timeout: (connect, read) timeout in seconds.
+        :param max_queue_wait: Longest wait for a provider's rate limiter before failing over to the next one.
+        """
+        self.providers = list(providers)
+        self.client = client
+        self.hedge_after = hedge_after
+        self.retry = retry or RetryPolicy()
+        self.timeout = timeout or (connect_timeout, read_timeout)
+        self.max_queue_wait = max_queue_wait
+
+    def ranked(self):
+        """
+        Orders healthy providers by median latency; providers without enough samples
+        come first so they get measured, and unhealthy ones are only used as a last resort.
+        """
+        def key(item):
+            index, provider = item
+            p50 = provider.stats.p50
+            return (not provider.stats.healthy, p50 is not None, p50 or 0.0, index)
+        return [provider for _, provider in sorted(enumerate(self.providers), key=key)]
+
+    def _prepare(self, provider, data, stream):
+        """
+        Builds the provider's request and queues behind its quota.
+        :return: URL, headers and JSON body, ready to send.
+        :raises RateLimitExceeded: If the queue is longer than max_queue_wait.
+        """
+        url, headers, body = provider.build_request(data, stream=stream)
+        # Queue behind this provider's quota; a rejection fails over without counting as an error
+        tokens = count_message_tokens(body["messages"]) + body.get("max_tokens", 0)
+        provider.limiter.acquire(tokens, max_wait=self.max_queue_wait)
+        return url, headers, body
+
+    def _send(self, provider, request, stream, timeout):
+        url, headers, body = request
+        start = time.monotonic()
+        try:
+            client = provider.transport or self.client()
+            # Serialized here, from the messages' cached JSON, instead of by the HTTP client
+            response = client.post(url, headers=headers, data=encode_request(body), stream=stream, timeout=timeout)
+        except Exception:
+            provider.stats.record(time.monotonic() - start, False)
+            metrics.observe_attempt(provider.name, "exception")
+            raise
+        provider.stats.record(time.monotonic() - start, response.status_code not in RETRYABLE_STATUS)
+        metrics.observe_attempt(provider.name, response.status_code, metrics.response_timings(response))
+        return response
+
+    def warm_up(self):
+        """
+        Sends a one-token request to every provider, so the first user does not pay
+        for loading a local model or opening connections. Failures are only logged.
+        """
+        data = {"messages": [{"role": "user", "content": "Hi"}], "max_tokens": 1}
+        for provider in self.providers:
+            start = time.monotonic()
+            try:
+                response = self._send(provider, self._prepare(provider, data, False), False, self.timeout)
+            except Exception as e:
+                logging.warning(f"Warm-up of {provider.name} failed: {e}")
+                continue
+            logging.info(f"Warmed up {provider.name} in {time.monotonic() - start:.2f}s (HTTP {response.status_code})")
+
+    def _hedge_delay(self, provider):
+        if self.hedge_after is not None:
+            return self.hedge_after or None
+        return provider.stats.p95
+
+    def post(self, data, stream=False, timeout=None, record=None):
+        """
+        Sends a request, failing over to the next provider on 5xx/429 or connection errors
+        and retrying with backoff once every provider has failed.
+        :param data: Request body without provider-specific fields.
+        :param timeout: (connect, read) timeout overriding the router's default.
+        :param record: Optional metrics.RequestRecord receiving the provider, status, timings and retries.
+        :return: The provider that answered and its response. If every attempt failed,
+                 the last error response is returned, or the last exception is raised.
+        """
+        timeout = timeout or self.timeout
+        attempt = 0
+        while True:
+            provider, response, error = self._post_once(data, stream, timeout)
+            if record is not None and response is not None:
+                record.provider = provider.name if provider is not None else None
+                record.status = response.status_code
+                record.timings = metrics.response_timings(response)
+            if provider is not None:
+                return provider, response
+            if response is None and isinstance(error, RateLimitExceeded):
+                break  # Every quota queue is longer than max_queue_wait; a short backoff will not help
+            attempt += 1
+            if attempt > self.retry.retries:
+                break
+            metrics.retries_total.inc()
+            if record is not None:
+                record.retries = attempt
+            delay = self.retry.delay(attempt, retry_after_seconds(response))
+            logging.warning(f"All providers failed; retrying in {delay:.2f}s (attempt {attempt} of {self.retry.retries})")
+            if response is not None:
+                response.close()
+            time.sleep(delay)
+
+        if response is not None:
+            return None, response
+        raise error
+
+    def _post_once(self, data, stream, timeout):
+        """
+        Tries each provider once, hedging and failing over as needed. Attempts
+        run on the caller's thread; only a request that may be hedged is sent
+        from the pool, so the caller can time it and take the first answer.
+        :return: (provider, response, None) on success, else (None, last error response, last exception).
+        """
+        candidates = self.ranked()
+        last_response, last_error = None, None
+        while candidates:
+            provider = candidates.pop(0)
+            try:
+                # Queue for quota first, so time spent waiting does not count toward the hedge delay
+                request = self._prepare(provider, data, stream)
+            except RateLimitExceeded as e:
+                logging.warning(f"Provider {provider.name} is over its quota: {e}")
+                last_error = e
+                continue
+            delay = self._hedge_delay(provider) if candidates else None
+            if delay is None:
+                attempts = [(provider, self._attempt(provider, request, stream, timeout))]
+            else:
+                attempts = self._post_hedged(provider, request, candidates, delay, data, stream, timeout)
+            for provider, (response, error) in attempts:
+                if error is not None:
+                    logging.warning(f"Provider {provider.name} failed: {error}")
+                    last_error = error
+                elif response.status_code in RETRYABLE_STATUS:
+                    logging.warning(f"Provider {provider.name} returned HTTP {response.status_code}")
+                    if last_response is not None:
+                        last_response.close()
+                    last_response = response
+                else:
+                    if last_response is not None:
+                        last_response.close()
+                    return provider, response, None
+        return None, last_response, last_error
+
+    def _attempt(self, provider, request, stream, timeout):
+        """
+        :return: (response, None), or (None, exception) if the request failed.
+        """
+        try:
+            return self._send(provider, request, stream, timeout), None
+        except Exception as e:
+            return None, e
+
+    def _prepare_and_attempt(self, provider, data, stream, timeout):
+        try:
+            request = self._prepare(provider, data, stream)
+        except RateLimitExceeded as e:
+            return None, e
+        return self._attempt(provider, request, stream, timeout)
+
+    def _post_hedged(self, provider, request, candidates, delay, data, stream, timeout):
+        """
+        Sends a request from the pool and, if it is slower than `delay`, the same
+        request to the next candidate.
+        :return: (provider, (response, error)) pairs in the order the attempts finished;
+                 the first successful one ends the list, and later ones are closed.
+        """
+        executor = _get_executor()
+        pending = {executor.submit(self._attempt, provider, request, stream, timeout): provider}
+        done, _ = wait(list(pending), timeout=delay)
+        if not done:
+            logging.info(f"Hedging request: {provider.name} is slower than {delay:.2f}s")
+            metrics.hedges_total.inc(provider=provider.name)
+            hedge = candidates.pop(0)
+            pending[executor.submit(self._prepare_and_attempt, hedge, data, stream, timeout)] = hedge
+
+        attempts = []
+        while pending:
+            done, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+            for future in done:
+                attempt = future.result()
+                attempts.append((pending.pop(future), attempt))
+                response, error = attempt
+                if error is None and response.status_code not in RETRYABLE_STATUS:
+                    # Drop the losing hedged request once it comes back
+                    for loser in pending:
+                        loser.add_done_callback(_close_response)
+                    return attempts
+        return attempts
+
+
+# Function to release the connection of an abandoned hedged request
+def _close_response(future):
+    response, _ = future.result()
+    if response is not None:
+        response.close()
@@ -0,0 +1,136 @@
+"""
+Client-side token-bucket rate limiting for requests/minute and tokens/minute quotas.
+
+Callers reserve capacity up front and sleep until their reservation is
+covered, so concurrent sessions queue in arrival order and bursts are spread
+out instead of being rejected by the provider. With a shared state server
+(core.shared_state), the buckets are kept there, so every worker process of
+the node draws from the same quota.
+"""
+import logging
+import threading
+import time
+
+import streamlit as st
+
+
+class RateLimitExceeded(Exception):
+    """Raised when a reservation would have to wait longer than allowed."""
+
+
+class TokenBucket:
+    """
+    A bucket refilled continuously at `rate` units per second, holding at most `capacity`.
+    """
+
+    def __init__(self, per_minute, capacity=None):
+        """
+        :param per_minute: Units (requests or tokens) allowed per minute.
+        :param capacity: Largest burst; defaults to one minute's worth.
+        """
+        self.rate = per_minute / 60.0
+        self.capacity = capacity or per_minute
+        self.level = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount, max_wait=None):
+        """
+        Takes `amount` units, letting the level go negative, and returns how long
+        the caller must wait before using them.
+        :raises RateLimitExceeded: If the wait would exceed max_wait; nothing is taken then.
+        """
+        with self.lock:
+            now = time.monotonic()
+            self._refill(now)
+            wait = max(0.0, (amount - self.level) / self.rate)
+            if max_wait is not None and wait > max_wait:
+                raise RateLimitExceeded(f"Rate limit queue is {wait:.1f}s long")
+            self.level -= amount
+            return wait
+
+    def refund(self, amount):
+        with self.lock:
+            self.level = min(self.capacity, self.level + amount)
+
+
+class SharedTokenBucket:
+    """
+    A TokenBucket kept in the node's shared state under a name.
+    When the state server is unreachable, requests are let through unlimited.
+    """
+
+    def __init__(self, state, name, per_minute):
+        self.state = state
+        self.name = name
+        self.per_minute = per_minute
+
+    def reserve(self, amount, max_wait=None):
+        try:
+            return self.state.reserve(self.name, self.per_minute, amount, max_wait)
+        except (OSError, EOFError) as e:
+            logging.warning(f"Shared rate limiter {self.name} is unavailable, not limiting: {e}")
+            return 0.0
+
+    def refund(self, amount):
+        try:
+            self.state.refund(self.name, self.per_minute, amount)
+        except (OSError, EOFError):
+            pass
+
+
+class RateLimiter:
+    """
+    Requests/minute and tokens/minute buckets for one provider.
+    """
+
+    def __init__(self, requests_per_minute=None, tokens_per_minute=None, state=None, name=None):
+        """
+        :param state: Optional core.shared_state state keeping the buckets, under `name`.
+        """
+        def bucket(per_minute, kind):
+            if not per_minute:
+                return None
+            if state is not None:
+                return SharedTokenBucket(state, f"ratelimit:{name}:{kind}", per_minute)
+            return TokenBucket(per_minute)
+
+        self.requests = bucket(requests_per_minute, "requests")
+        self.tokens = bucket(tokens_per_minute, "tokens")
+
+    def acquire(self, tokens=0, max_wait=None):
+        """
+        Blocks until one request and `tokens` tokens may be sent.
+        :param tokens: Estimated prompt plus completion tokens of the request.
+        :param max_wait: Seconds the caller is willing to queue; None waits indefinitely.
+        :raises RateLimitExceeded: If the queue is longer than max_wait.
+        """
+        wait = 0.0
+        if self.requests is not None:
+            wait = self.requests.reserve(1, max_wait)
+        if self.tokens is not None and tokens:
+            try:
+                wait = max(wait, self.tokens.reserve(tokens, max_wait))
+            except RateLimitExceeded:
+                if self.requests is not None:
+                    self.requests.refund(1)
+                raise
+        if wait:
+            time.sleep(wait)
+        return wait
+
+
+# Function to get the process-wide limiter of a provider
+@st.cache_resource(show_spinner=False)
+def get_rate_limiter(name, requests_per_minute=None, tokens_per_minute=None):
+    """
+    Returns the limiter shared by all sessions for a provider, and by all
+    worker processes when a shared state server is configured.
+    """
+    from core.shared_state import get_shared_state
+
+    return RateLimiter(requests_per_minute, tokens_per_minute, get_shared_state(), name)
@@ -0,0 +1,66 @@
+"""
+Redaction of secrets from log output.
+
+A logging filter installed on the root handlers masks bearer tokens, API key
+fields and the literal values of the configured provider keys, whatever
+logger or library emits them.
+"""
+import logging
+import re
+
+from core.config import PROVIDER_PRESETS, get_secret
+
+mask = "[REDACTED]"
+
+_patterns = [
+    re.compile(r"(Bearer\s+)[^\s'\",}]+", re.IGNORECASE),
+    re.compile(r"((?:api[_-]?key|authorization|token)['\"]?\s*[:=]\s*['\"]?)[^\s'\",}]+", re.IGNORECASE),
+]
+
+
+# Function to mask the secrets in a text
+def redact(text, secrets=()):
+    """
+    :param secrets: Literal secret values to mask in addition to the patterns.
+    """
+    for secret in secrets:
+        text = text.replace(secret, mask)
+    for pattern in _patterns:
+        text = pattern.sub(lambda match: match.group(1) + mask, text)
+    return text
+
+
+class RedactingFilter(logging.Filter):
+    """
+    Formats each record's message once and replaces it with its redacted form.
+    """
+
+    def __init__(self, secrets=()):
+        super().__init__()
+        # Short values would mask unrelated text, and real keys are long
+        self.secrets = [secret for secret in secrets if secret and len(secret) >= 8]
+
+    def filter(self, record):
+        message = record.getMessage()
+        redacted = redact(message, self.secrets)
+        if redacted != message:
+            record.msg, record.args = redacted, None
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        if record.exc_text:
+            record.exc_text = redact(record.exc_text, self.secrets)
+        return True
+
+
+# Function to redact secrets from everything the root logger's handlers write
+def install_log_redaction():
+    """
+    Call after logging.basicConfig. Safe to call on every Streamlit rerun.
+    """
+    secrets = [get_secret(preset["api_key_name"]) for preset in PROVIDER_PRESETS.values()]
+    log_filter = RedactingFilter(secrets)
+    # Without configured handlers, warnings go to logging.lastResort
+    for handler in logging.getLogger().handlers or [logging.lastResort]:
+        for existing in [f for f in handler.filters if isinstance(f, RedactingFilter)]:
+            handler.removeFilter(existing)
+        handler.addFilter(log_filter)
@@ -0,0 +1,45 @@
+"""
+Incremental rendering helpers for the chat history.
+
+Messages carry a stable ID, and the markdown prepared for each message is
+cached per ID, so reruns only format messages that are new or have changed
+(IDs come from core.history.new_message).
+"""
+
+
+# Function to format message content as markdown
+def format_markdown(label, content):
+    """
+    Prefixes the speaker label and escapes dollar signs, which Streamlit would
+    otherwise render as LaTeX (e.g. prices like $5 and $10).
+    """
+    escaped = content.replace("$", "\\$")
+    return f"{label}: {escaped}"
+
+
+class MarkdownCache:
+    """
+    Per-session cache of the markdown prepared for each message ID.
+    """
+
+    def __init__(self):
+        self.entries = {}
+
+    def render(self, message_id, label, content):
+        """
+        :return: The markdown for the message, formatted only if it is new or its content changed.
+        """
+        if message_id is None:
+            return format_markdown(label, content)
+        entry = self.entries.get(message_id)
+        if entry is None or entry[0] != len(content):
+            entry = (len(content), format_markdown(label, content))
+            self.entries[message_id] = entry
+        return entry[1]
+
+    def retain(self, messages):
+        """Drops entries of messages that are no longer in the history."""
+        live = {msg.get('id') for msg in messages}
+        for message_id in list(self.entries):
+            if message_id not in live:
+                del self.entries[message_id]
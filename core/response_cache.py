@@ -0,0 +1,286 @@
+"""
+Response cache for repeated prompts.
+
+Entries are keyed on the normalized message list plus the sampling parameters.
+Lookups go through an in-memory LRU, then an optional SQLite tier with TTL and
+size-based eviction (or, without one, the node's shared state server, so
+worker processes share hits), then an optional embedding-similarity match on
+the last user message.
+"""
+import hashlib
+import json
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import streamlit as st
+
+# Configuration (override through environment variables)
+memory_size = int(os.getenv("RESPONSE_CACHE_SIZE", "512"))  # Entries kept in memory; 0 disables the cache
+db_path = os.getenv("RESPONSE_CACHE_DB", "")  # SQLite file for the disk tier; empty disables it
+ttl_seconds = float(os.getenv("RESPONSE_CACHE_TTL", "86400"))
+max_db_bytes = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(100 * 1024 * 1024)))
+semantic_threshold = float(os.getenv("RESPONSE_CACHE_SEMANTIC_THRESHOLD", "0") or 0)  # Cosine similarity; 0 disables
+semantic_size = int(os.getenv("RESPONSE_CACHE_SEMANTIC_SIZE", "2048"))
+
+
+# Function to normalize a message list for cache keys
+def normalize_messages(messages):
+    """
+    Drops everything but role and content and collapses whitespace, so that
+    trivially different spellings of the same conversation share a key.
+    """
+    return [
+        {"role": msg["role"].strip().lower(), "content": " ".join(str(msg["content"]).split())}
+        for msg in messages
+    ]
+
+
+# Function to hash a JSON-serializable value
+def _digest(value):
+    return hashlib.sha256(json.dumps(value, sort_keys=True, separators=(",", ":")).encode("utf-8")).hexdigest()
+
+
+# Function to extract the parameters that affect a completion
+def request_params(data):
+    """
+    :param data: JSON body of a chat completions request.
+    :return: Everything but the messages and transport options.
+    """
+    return {k: v for k, v in data.items() if k not in ("messages", "stream", "stream_options")}
+
+
+# Function to compute the cache key of a request
+def make_key(messages, params):
+    """
+    :param messages: List of messages (conversation history).
+    :param params: Dict of model, temperature, top_p and max_tokens.
+    :return: A hex digest identifying the request.
+    """
+    return _digest({"messages": normalize_messages(messages), "params": params})
+
+
+# Function to compute the similarity bucket of a request
+def _semantic_bucket(messages, params):
+    """
+    Requests can only match semantically if everything but the last user
+    message is identical, so earlier turns never leak between conversations.
+    """
+    normalized = normalize_messages(messages)
+    return _digest({"messages": normalized[:-1], "params": params}), normalized[-1]["content"]
+
+
+# Function to compute cosine similarity
+def _cosine(a, b):
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+class SQLiteTier:
+    """
+    Disk tier storing responses in a SQLite table, with TTL expiry and eviction
+    of the least recently used rows once the total size exceeds max_bytes.
+    """
+
+    def __init__(self, path, ttl=ttl_seconds, max_bytes=max_db_bytes):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY, response TEXT NOT NULL, size INTEGER NOT NULL,"
+            " created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+
+    def get(self, key):
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute("SELECT response, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if now - row[1] > self.ttl:
+                self.conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                return None
+            self.conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+            return row[0]
+
+    def put(self, key, response):
+        now = time.time()
+        size = len(response.encode("utf-8"))
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO responses (key, response, size, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                (key, response, size, now, now),
+            )
+            self._evict(now)
+
+    def _evict(self, now):
+        self.conn.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl,))
+        total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        excess = total - self.max_bytes
+        doomed = []
+        for key, size in self.conn.execute("SELECT key, size FROM responses ORDER BY accessed"):
+            doomed.append((key,))
+            excess -= size
+            if excess <= 0:
+                break
+        self.conn.executemany("DELETE FROM responses WHERE key = ?", doomed)
+
+
+class SharedTier:
+    """
+    Tier keeping responses in the node's shared state (core.shared_state), with TTL expiry.
+    """
+
+    def __init__(self, state, ttl=ttl_seconds):
+        self.state = state
+        self.ttl = ttl
+
+    def get(self, key):
+        return self.state.get(f"response:{key}")
+
+    def put(self, key, response):
+        self.state.set(f"response:{key}", response, self.ttl)
+
+
+class ResponseCache:
+    """
+    Two-tier exact-match cache with an optional semantic lookup.
+    """
+
+    def __init__(self, maxsize=memory_size, disk=None, embed=None, threshold=semantic_threshold):
+        """
+        :param maxsize: Number of responses kept in the in-memory LRU.
+        :param disk: Optional SQLiteTier.
+        :param embed: Optional function mapping a list of texts to a list of vectors.
+        :param threshold: Minimum cosine similarity for a semantic hit; 0 disables it.
+        """
+        self.maxsize = maxsize
+        self.disk = disk
+        self.embed = embed if threshold else None
+        self.threshold = threshold
+        self.lock = threading.Lock()
+        self.memory = OrderedDict()
+        self.vectors = OrderedDict()  # bucket -> OrderedDict(text -> (vector, key))
+        # Embedding a stored prompt is an HTTP call; replies do not wait for it
+        self.indexer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="cache-index") if self.embed else None
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, messages, params):
+        """
+        :return: The cached response text, or None.
+        """
+        key = make_key(messages, params)
+        response = self._get_exact(key)
+        if response is None and self.embed is not None:
+            response = self._get_similar(messages, params)
+        with self.lock:
+            if response is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return response
+
+    def put(self, messages, params, response):
+        key = make_key(messages, params)
+        self._remember(key, response)
+        if self.disk is not None:
+            try:
+                self.disk.put(key, response)
+            except (sqlite3.Error, OSError, EOFError) as e:
+                logging.warning(f"Response cache disk write failed: {e}")
+        if self.embed is not None:
+            self.indexer.submit(self._index, messages, params, key)
+
+    def _remember(self, key, response):
+        with self.lock:
+            self.memory[key] = response
+            self.memory.move_to_end(key)
+            while len(self.memory) > self.maxsize:
+                self.memory.popitem(last=False)
+
+    def _get_exact(self, key):
+        with self.lock:
+            if key in self.memory:
+                self.memory.move_to_end(key)
+                return self.memory[key]
+        if self.disk is None:
+            return None
+        try:
+            response = self.disk.get(key)
+        except (sqlite3.Error, OSError, EOFError) as e:
+            logging.warning(f"Response cache disk read failed: {e}")
+            return None
+        if response is not None:
+            self._remember(key, response)
+        return response
+
+    def _embed_one(self, text):
+        try:
+            return self.embed([text])[0]
+        except Exception as e:
+            logging.warning(f"Response cache embedding failed: {e}")
+            return None
+
+    def _index(self, messages, params, key):
+        bucket, text = _semantic_bucket(messages, params)
+        vector = self._embed_one(text)
+        if vector is None:
+            return
+        with self.lock:
+            entries = self.vectors.setdefault(bucket, OrderedDict())
+            entries[text] = (vector, key)
+            self.vectors.move_to_end(bucket)
+            while sum(len(e) for e in self.vectors.values()) > semantic_size:
+                oldest = next(iter(self.vectors.values()))
+                oldest.popitem(last=False)
+                if not oldest:
+                    self.vectors.popitem(last=False)
+
+    def _get_similar(self, messages, params):
+        bucket, text = _semantic_bucket(messages, params)
+        with self.lock:
+            candidates = list(self.vectors.get(bucket, {}).values())
+        if not candidates:
+            return None
+        vector = self._embed_one(text)
+        if vector is None:
+            return None
+        score, key = max((_cosine(vector, v), k) for v, k in candidates)
+        if score < self.threshold:
+            return None
+        logging.debug(f"Semantic response cache hit (similarity {score:.3f})")
+        return self._get_exact(key)
+
+
+# Function to get the process-wide response cache
+@st.cache_resource(show_spinner=False)
+def get_response_cache(embedding_model=None, _embed=None):
+    """
+    Returns the cache shared by all Streamlit sessions, configured from the
+    RESPONSE_CACHE_* environment variables, or None when it is disabled.
+    :param embedding_model: Name of the embedding model behind _embed; apps using
+                            different ones (or none) get separate caches.
+    :param _embed: Optional embedding function enabling semantic lookups.
+    """
+    if memory_size <= 0:
+        return None
+    from core.shared_state import get_shared_state
+
+    disk = SQLiteTier(db_path) if db_path else None
+    if disk is None and get_shared_state() is not None:
+        disk = SharedTier(get_shared_state())
+    return ResponseCache(disk=disk, embed=_embed)
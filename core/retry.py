@@ -0,0 +1,57 @@
+"""
+Retry policy: exponential backoff with full jitter that honors Retry-After.
+"""
+import email.utils
+import os
+import random
+import time
+
+# Configuration (override through environment variables)
+max_retries = int(os.getenv("HTTP_MAX_RETRIES", "3"))
+backoff_base = float(os.getenv("HTTP_BACKOFF_BASE", "0.5"))  # Seconds before the first retry
+backoff_max = float(os.getenv("HTTP_BACKOFF_MAX", "20"))  # Upper bound for any single wait
+connect_timeout = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+read_timeout = float(os.getenv("HTTP_READ_TIMEOUT", "120"))  # Longest silence between bytes of a response
+
+
+# Function to read the Retry-After header of a response
+def retry_after_seconds(response):
+    """
+    :return: Seconds to wait as requested by the server, or None.
+    """
+    if response is None:
+        return None
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - time.time())
+
+
+class RetryPolicy:
+    """
+    Decides how often and how long to wait between attempts.
+    """
+
+    def __init__(self, retries=max_retries, base=backoff_base, cap=backoff_max):
+        self.retries = retries
+        self.base = base
+        self.cap = cap
+
+    def delay(self, attempt, retry_after=None):
+        """
+        :param attempt: Number of attempts already made (1 after the first failure).
+        :param retry_after: Server-requested wait, which takes precedence when longer.
+        :return: Seconds to sleep before the next attempt.
+        """
+        backoff = random.uniform(0, min(self.cap, self.base * 2 ** (attempt - 1)))
+        if retry_after is not None:
+            return min(self.cap, max(backoff, retry_after))
+        return backoff
@@ -0,0 +1,242 @@
+"""
+State shared by the worker processes of one node.
+
+Several Streamlit processes behind a load balancer each have their own module
+globals, so their response caches and rate limiters would diverge. When
+SHARED_STATE_ADDRESS is set, the workers keep that state instead in one state
+server reached over a local socket (serve.py runs it next to the workers).
+Conversations already are shared: they live in the SQLite conversation store,
+which every worker on the node opens.
+
+LocalState holds the state in-process. It is what the server wraps, and a
+stand-in for tests and single-process deployments.
+
+Connections unpickle what they receive, so only holders of the authkey may
+connect: TCP addresses require SHARED_STATE_AUTHKEY, and Unix sockets are
+only accessible to the user running the server.
+"""
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from multiprocessing.connection import AuthenticationError, Client, Listener
+
+import streamlit as st
+
+from core.ratelimit import TokenBucket
+
+# Configuration (override through environment variables)
+address = os.getenv("SHARED_STATE_ADDRESS", "")  # Unix socket path, or host:port; empty keeps state in each process
+authkey = os.getenv("SHARED_STATE_AUTHKEY", "")  # Shared secret of the server and its clients; serve.py generates one
+max_entries = int(os.getenv("SHARED_STATE_MAX_ENTRIES", "10000"))  # Values kept before the least recently used are dropped
+
+# Key used on Unix sockets when none is set; the socket's file permissions keep other users out
+_default_authkey = "chat-shared-state"
+
+# Methods a client may call on the server's state
+_methods = ("get", "set", "delete", "reserve", "refund")
+
+
+# Function to parse a state server address
+def parse_address(text):
+    """
+    :return: A (host, port) tuple for "host:port", otherwise the text as a Unix socket path.
+    """
+    host, _, port = text.rpartition(":")
+    if host and port.isdigit() and "/" not in text:
+        return host, int(port)
+    return text
+
+
+# Function to get the authentication key for an address
+def resolve_authkey(address, key=None):
+    """
+    :param key: Key to use instead of SHARED_STATE_AUTHKEY.
+    :return: The key as bytes.
+    :raises ValueError: For a TCP address without a key, which anyone reaching the port could use.
+    """
+    key = key or authkey
+    if not key:
+        if not isinstance(parse_address(address), str):
+            raise ValueError(f"Shared state address {address} is a TCP address; set SHARED_STATE_AUTHKEY")
+        key = _default_authkey
+    return key.encode("utf-8")
+
+
+class LocalState:
+    """
+    Values with an optional TTL, evicted least recently used first, and named token buckets.
+    """
+
+    def __init__(self, max_entries=max_entries):
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.values = OrderedDict()
+        self.buckets = {}
+
+    def get(self, key):
+        """
+        :return: The value, or None if it is missing or expired.
+        """
+        with self.lock:
+            item = self.values.get(key)
+            if item is None:
+                return None
+            value, expires = item
+            if expires is not None and expires < time.time():
+                del self.values[key]
+                return None
+            self.values.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        """
+        :param ttl: Seconds the value is kept; None keeps it until it is evicted.
+        """
+        with self.lock:
+            self.values[key] = (value, time.time() + ttl if ttl else None)
+            self.values.move_to_end(key)
+            while len(self.values) > self.max_entries:
+                self.values.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.values.pop(key, None)
+
+    def _bucket(self, name, per_minute):
+        with self.lock:
+            bucket = self.buckets.get(name)
+            if bucket is None or bucket.capacity != per_minute:
+                bucket = self.buckets[name] = TokenBucket(per_minute)
+            return bucket
+
+    def reserve(self, name, per_minute, amount, max_wait=None):
+        """
+        Reserves units of a core.ratelimit.TokenBucket, created on first use.
+        :return: Seconds the caller must wait before using them.
+        :raises RateLimitExceeded: If the wait would exceed max_wait.
+        """
+        return self._bucket(name, per_minute).reserve(amount, max_wait)
+
+    def refund(self, name, per_minute, amount):
+        self._bucket(name, per_minute).refund(amount)
+
+
+class RemoteState:
+    """
+    Client of a StateServer with the same methods as LocalState. Each thread
+    keeps its own connection, so concurrent sessions do not wait on each other.
+    """
+
+    def __init__(self, address):
+        self.address = parse_address(address)
+        self.authkey = resolve_authkey(address)
+        self.local = threading.local()
+
+    def _call(self, method, *args):
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = self.local.conn = Client(self.address, authkey=self.authkey)
+        try:
+            conn.send((method, args))
+            status, result = conn.recv()
+        except (OSError, EOFError):
+            self.local.conn = None  # Reconnect on the next call, e.g. after a server restart
+            raise
+        if status == "error":
+            raise result
+        return result
+
+    def get(self, key):
+        return self._call("get", key)
+
+    def set(self, key, value, ttl=None):
+        self._call("set", key, value, ttl)
+
+    def delete(self, key):
+        self._call("delete", key)
+
+    def reserve(self, name, per_minute, amount, max_wait=None):
+        return self._call("reserve", name, per_minute, amount, max_wait)
+
+    def refund(self, name, per_minute, amount):
+        self._call("refund", name, per_minute, amount)
+
+
+class StateServer:
+    """
+    Serves a LocalState to the workers of the node, one thread per connection.
+    """
+
+    def __init__(self, address, state=None, key=None):
+        """
+        :param key: Authentication key; defaults to SHARED_STATE_AUTHKEY (see resolve_authkey).
+        """
+        self.state = state or LocalState()
+        self.address = parse_address(address)
+        secret = resolve_authkey(address, key)
+        if isinstance(self.address, str):
+            if os.path.exists(self.address):
+                os.unlink(self.address)  # Left behind by a server that did not shut down cleanly
+            # Created without group or other permissions, so only this user's processes can connect
+            old_umask = os.umask(0o077)
+            try:
+                self.listener = Listener(self.address, authkey=secret)
+            finally:
+                os.umask(old_umask)
+        else:
+            self.listener = Listener(self.address, authkey=secret)
+        self.closed = False
+
+    def serve_forever(self):
+        logging.info(f"Serving shared state on {self.address}")
+        while not self.closed:
+            try:
+                conn = self.listener.accept()
+            except (OSError, EOFError, AuthenticationError) as e:
+                if self.closed:
+                    return
+                logging.warning(f"Rejected a shared state connection: {e}")
+                continue
+            threading.Thread(target=self._handle, args=(conn,), name="shared-state", daemon=True).start()
+
+    def _handle(self, conn):
+        with conn:
+            while True:
+                try:
+                    method, args = conn.recv()
+                except (OSError, EOFError):
+                    return
+                if method not in _methods:
+                    conn.send(("error", ValueError(f"Unknown shared state method {method!r}")))
+                    continue
+                try:
+                    conn.send(("ok", getattr(self.state, method)(*args)))
+                except Exception as e:
+                    conn.send(("error", e))
+
+    def close(self):
+        self.closed = True
+        self.listener.close()
+
+
+# Function to get the client of the node's shared state
+@st.cache_resource(show_spinner=False)
+def get_shared_state():
+    """
+    :return: A RemoteState for SHARED_STATE_ADDRESS, or None when every process keeps its own state.
+    """
+    if not address:
+        return None
+    return RemoteState(address)
+
+
+# Function to start a state server on a daemon thread
+def start_state_server(address, state=None, key=None):
+    """
+    :return: The StateServer, e.g. for serve.py or a test.
+    """
+    server = StateServer(address, state, key)
+    threading.Thread(target=server.serve_forever, name="shared-state-server", daemon=True).start()
+    return server
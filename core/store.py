@@ -0,0 +1,180 @@
+"""
+Persistent conversation storage.
+
+Messages are written one at a time as they are produced and read back lazily
+a page at a time, so a session only needs to keep the tail of its
+conversation in memory, and a user can resume a chat after reconnecting.
+"""
+from abc import ABC, abstractmethod
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+import streamlit as st
+
+from core.history import Message
+
+# Configuration (override through environment variables)
+base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+default_db_path = os.getenv("CONVERSATION_DB", os.path.join(base_dir, ".cache", "conversations.db"))
+
+
+class ConversationStore(ABC):
+    """
+    Interface of a conversation store. Messages are core.history.Message records (or dicts)
+    with 'id', 'role' and 'content'.
+    """
+
+    @abstractmethod
+    def create_conversation(self):
+        """
+        :return: The ID of a new, empty conversation.
+        """
+        pass
+
+    @abstractmethod
+    def exists(self, conversation_id):
+        pass
+
+    @abstractmethod
+    def append(self, conversation_id, message):
+        """Stores a new message at the end of the conversation."""
+        pass
+
+    @abstractmethod
+    def update_content(self, conversation_id, message_id, content):
+        """Replaces the content of a stored message, e.g. after a continuation."""
+        pass
+
+    @abstractmethod
+    def load_page(self, conversation_id, before_id=None, limit=20):
+        """
+        :param before_id: Only return messages older than this message; None starts from the newest.
+        :param limit: Maximum number of messages.
+        :return: Up to `limit` messages in chronological order.
+        """
+        pass
+
+    @abstractmethod
+    def has_earlier(self, conversation_id, message_id):
+        """
+        :return: True if messages older than `message_id` are stored.
+        """
+        pass
+
+    @abstractmethod
+    def save_state(self, conversation_id, summary, last_response_complete):
+        """Stores the rolling summary and whether the last reply was complete."""
+        pass
+
+    @abstractmethod
+    def load_state(self, conversation_id):
+        """
+        :return: Dict with 'summary' and 'last_response_complete'.
+        """
+        pass
+
+
+class SQLiteConversationStore(ConversationStore):
+    """
+    Conversation store backed by a SQLite file in WAL mode, safe to share between threads.
+    """
+
+    def __init__(self, path=default_db_path):
+        self.lock = threading.Lock()
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS conversations ("
+            " id TEXT PRIMARY KEY, created REAL NOT NULL, updated REAL NOT NULL,"
+            " summary TEXT, last_response_complete INTEGER NOT NULL DEFAULT 1)"
+        )
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS messages ("
+            " seq INTEGER PRIMARY KEY AUTOINCREMENT, conversation_id TEXT NOT NULL, id TEXT NOT NULL UNIQUE,"
+            " role TEXT NOT NULL, content TEXT NOT NULL, created REAL NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS messages_conversation ON messages (conversation_id, seq)")
+
+    def create_conversation(self):
+        conversation_id = uuid.uuid4().hex
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                "INSERT INTO conversations (id, created, updated) VALUES (?, ?, ?)",
+                (conversation_id, now, now),
+            )
+        return conversation_id
+
+    def exists(self, conversation_id):
+        with self.lock:
+            row = self.conn.execute("SELECT 1 FROM conversations WHERE id = ?", (conversation_id,)).fetchone()
+        return row is not None
+
+    def append(self, conversation_id, message):
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                "INSERT INTO messages (conversation_id, id, role, content, created) VALUES (?, ?, ?, ?, ?)",
+                (conversation_id, message['id'], message['role'], message['content'], now),
+            )
+            self.conn.execute("UPDATE conversations SET updated = ? WHERE id = ?", (now, conversation_id))
+
+    def update_content(self, conversation_id, message_id, content):
+        with self.lock:
+            self.conn.execute(
+                "UPDATE messages SET content = ? WHERE conversation_id = ? AND id = ?",
+                (content, conversation_id, message_id),
+            )
+
+    def load_page(self, conversation_id, before_id=None, limit=20):
+        query = "SELECT id, role, content FROM messages WHERE conversation_id = ?"
+        params = [conversation_id]
+        if before_id is not None:
+            query += " AND seq < (SELECT seq FROM messages WHERE id = ?)"
+            params.append(before_id)
+        query += " ORDER BY seq DESC LIMIT ?"
+        params.append(limit)
+        with self.lock:
+            rows = self.conn.execute(query, params).fetchall()
+        return [Message(row[1], row[2], row[0]) for row in reversed(rows)]
+
+    def has_earlier(self, conversation_id, message_id):
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT 1 FROM messages WHERE conversation_id = ?"
+                " AND seq < (SELECT seq FROM messages WHERE id = ?) LIMIT 1",
+                (conversation_id, message_id),
+            ).fetchone()
+        return row is not None
+
+    def save_state(self, conversation_id, summary, last_response_complete):
+        with self.lock:
+            self.conn.execute(
+                "UPDATE conversations SET summary = ?, last_response_complete = ?, updated = ? WHERE id = ?",
+                (summary, int(last_response_complete), time.time(), conversation_id),
+            )
+
+    def load_state(self, conversation_id):
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT summary, last_response_complete FROM conversations WHERE id = ?",
+                (conversation_id,),
+            ).fetchone()
+        if row is None:
+            return {'summary': None, 'last_response_complete': True}
+        return {'summary': row[0], 'last_response_complete': bool(row[1])}
+
+
+# Function to get the process-wide conversation store
+@st.cache_resource(show_spinner=False)
+def get_conversation_store(path=default_db_path):
+    """
+    Returns the store shared by all sessions in this server process.
+    """
+    return SQLiteConversationStore(path)
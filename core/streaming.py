@@ -0,0 +1,137 @@
+"""
+Parsing of OpenAI-compatible server-sent event (SSE) streams.
+"""
+import json
+import logging
+import time
+
+
+# Function to iterate over the JSON payloads of an SSE response
+def iter_sse_data(lines):
+    """
+    Yields the decoded JSON payload of every `data:` event in an SSE stream.
+    :param lines: Iterable of raw lines (bytes or str), e.g. response.iter_lines().
+    """
+    for line in lines:
+        if not line:
+            continue
+        if isinstance(line, bytes):
+            line = line.decode("utf-8")
+        if not line.startswith("data:"):
+            continue  # Comments, keep-alives and other SSE fields
+        payload = line[len("data:"):].strip()
+        if payload == "[DONE]":
+            return
+        try:
+            yield json.loads(payload)
+        except ValueError:
+            logging.warning(f"Skipping malformed SSE payload: {payload[:200]}")
+
+
+# Function to cut a text at the first of several stop sequences
+def truncate_at_stop(text, stop):
+    """
+    :return: The text before the earliest stop sequence, and whether one was found.
+    """
+    found = [index for index in (text.find(sequence) for sequence in stop if sequence) if index >= 0]
+    if not found:
+        return text, False
+    return text[:min(found)], True
+
+
+class ChatStream:
+    """
+    Iterates over the text chunks of a streamed chat completion.
+
+    The full text, `finish_reason` and `usage` (when the provider sends it) are
+    available once the stream has been consumed; `first_chunk_at` is the
+    time.monotonic() at which the first text arrived.
+    """
+
+    def __init__(self, response, on_complete=None, on_finish=None, stop=()):
+        """
+        :param response: A streaming `requests.Response` for a chat completions call.
+        :param on_complete: Optional callback receiving the stream once it finished without errors.
+        :param on_finish: Optional callback receiving the stream once it ended, even on errors.
+        :param stop: Stop sequences, also enforced here for providers that ignore or limit `stop`:
+            the text ends before the first one and the connection is closed.
+        """
+        self.response = response
+        self.on_complete = on_complete
+        self.on_finish = on_finish
+        self.stop = tuple(stop or ())
+        self.first_chunk_at = None
+        self.chunks = []
+        self.finish_reason = None
+        self.usage = None
+        self.error = None
+
+    @property
+    def text(self):
+        return "".join(self.chunks)
+
+    def __iter__(self):
+        try:
+            for content in self._contents():
+                if self.first_chunk_at is None:
+                    self.first_chunk_at = time.monotonic()
+                self.chunks.append(content)
+                yield content
+        except Exception as e:
+            logging.exception("Exception occurred while reading the response stream")
+            self.error = e
+        else:
+            if self.on_complete is not None:
+                self.on_complete(self)
+        finally:
+            self.close()
+            if self.on_finish is not None:
+                self.on_finish(self)
+
+    def _contents(self):
+        """Yields the text deltas, ending before the first stop sequence."""
+        held = ""  # Tail that could still be the start of a stop sequence
+        holdback = max((len(sequence) for sequence in self.stop), default=1) - 1
+        for event in iter_sse_data(self.response.iter_lines()):
+            if event.get("usage"):
+                self.usage = event["usage"]
+            for choice in event.get("choices") or []:
+                delta = choice.get("delta") or {}
+                content = delta.get("content")
+                if content and not self.stop:
+                    yield content
+                elif content:
+                    held, stopped = truncate_at_stop(held + content, self.stop)
+                    if stopped:
+                        if held:
+                            yield held
+                        self.finish_reason = "stop"
+                        return  # Closing the connection ends the generation upstream
+                    if len(held) > holdback:
+                        yield held[:len(held) - holdback]
+                        held = held[len(held) - holdback:]
+                if choice.get("finish_reason"):
+                    self.finish_reason = choice["finish_reason"]
+        if held:
+            yield held
+
+    def close(self):
+        """Release the underlying connection, e.g. when the reader stops early."""
+        self.response.close()
+
+
+class ReplayStream(ChatStream):
+    """
+    A ChatStream over a response that is already complete, e.g. a cache hit.
+    """
+
+    def __init__(self, text, finish_reason="stop"):
+        super().__init__(None)
+        self.chunks = [text]
+        self.finish_reason = finish_reason
+
+    def __iter__(self):
+        yield from self.chunks
+
+    def close(self):
+        pass
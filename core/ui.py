@@ -0,0 +1,438 @@
+"""
+Streamlit chat page shared by app.py and app0.py.
+
+The page only differs between the apps by its ChatSettings; the client is
+built once per server process and images are loaded on first render, so
+importing an app neither touches the network nor repeats setup on reruns.
+"""
+from itertools import chain
+
+import streamlit as st
+from streamlit.errors import StreamlitAPIException
+
+from core.client import get_chat_client, is_error_response, is_response_complete
+from core.context import count_tokens
+from core.history import init_conversation, new_message, save_conversation_state, start_new_conversation, store_message
+from core.images import icon_source, load_image_from_url
+from core.prefetch import Prefetcher
+from core.rendering import MarkdownCache, format_markdown
+from core.store import get_conversation_store
+from core.streaming import ChatStream
+from core.validation import validate_input
+
+# Replace with your actual image URLs
+logo_url = "https://www.itworldcanada.com/ai/wp-content/uploads/2018/06/Wcem1g-S_400x400-1.jpg"  # Replace with your logo URL
+user_icon_url = "https://cdn-icons-png.flaticon.com/512/3686/3686930.png"  # Example user icon
+llm_icon_url = "https://cdn-icons-png.flaticon.com/256/10645/10645125.png"  # Replace with your LLM icon URL
+
+model_description = """
+**NVIDIA LLaMA 3.1 Nemotron-70B Instruct**  
+A state-of-the-art large language model developed by NVIDIA, featuring 70 billion parameters.  
+Designed for advanced natural language understanding and generation, it provides contextually accurate and instruction-following responses.
+"""
+
+
+# Function to display messages with icons
+def display_message(role, content, message_id=None):
+    """
+    Displays a message with an icon based on the role.
+    :param role: 'user' or 'assistant'
+    :param content: The message content, or an iterable of text chunks rendered as they arrive
+    :param message_id: ID of a stored message, used to reuse its cached markdown
+    :return: The full message text
+    """
+    # Icons are passed to the browser by URL, so it downloads and caches them once
+    if role == 'user':
+        icon = icon_source(user_icon_url, fallback="user_icon.png")
+        label = "**You**"
+    elif role == 'assistant':
+        icon = icon_source(llm_icon_url, fallback="llm_icon.png")
+        label = "**LLaMA**"
+    else:
+        icon = None
+        label = f"**{role.capitalize()}**"
+
+    with st.chat_message(role, avatar=icon):
+        return _render_content(label, content, message_id)
+
+
+# Function to render message content, progressively if it is streamed
+def _render_content(label, content, message_id=None):
+    if isinstance(content, str):
+        st.markdown(_markdown_cache().render(message_id, label, content))
+        return content
+
+    placeholder = st.empty()
+    text = ""
+    for chunk in content:
+        text += chunk
+        placeholder.markdown(format_markdown(label, text) + "▌")
+    placeholder.markdown(format_markdown(label, text))
+    return text
+
+
+# Function to display a reply, or a continuation inside the partial message it extends
+def _display_reply(content, partial=None, placeholder=None):
+    """
+    :param content: The reply text, or an iterable of text chunks rendered as they arrive.
+    :param partial: Text of the partial message a continuation extends.
+    :param placeholder: st.empty() holding that message; None draws a new message.
+    :return: The reply text, without the partial message.
+    """
+    if placeholder is None:
+        return display_message("assistant", content)
+    with placeholder.container():
+        if isinstance(content, str):
+            display_message("assistant", partial + content)
+            return content
+        return display_message("assistant", chain([partial], content))[len(partial):]
+
+
+# Function to get this session's cache of rendered messages
+def _markdown_cache():
+    if 'markdown_cache' not in st.session_state:
+        st.session_state.markdown_cache = MarkdownCache()
+    return st.session_state.markdown_cache
+
+
+# Function to get this session's prefetcher, or None when prefetching is disabled
+def _prefetcher(client):
+    if not client.settings.prefetch_token_budget:
+        return None
+    if 'prefetcher' not in st.session_state:
+        st.session_state.prefetcher = Prefetcher(client, client.settings.prefetch_token_budget)
+    return st.session_state.prefetcher
+
+
+# Function to start the requests the user is likely to make next
+def _prefetch_next(client):
+    """
+    Prefetches the continuation of a truncated reply, or suggests follow-ups to a complete one.
+    """
+    prefetcher = _prefetcher(client)
+    state = st.session_state.conversation_state
+    if prefetcher is None or not state['messages'] or state['messages'][-1]['role'] != 'assistant':
+        return
+    if not state['last_response_complete']:
+        prefetcher.prefetch(client.context_window.build(state), prefill=True)
+    elif client.settings.follow_up_suggestions and not is_error_response(state['messages'][-1]['content']):
+        prefetcher.suggest(client.context_window.build(state), client.settings.follow_up_suggestions)
+
+
+# Function to show the suggested follow-ups, once generated in the background
+def _show_suggestions(client):
+    """
+    :return: The suggestion the user clicked, or None.
+    """
+    prefetcher = _prefetcher(client)
+    if prefetcher is None or not st.session_state.conversation_state['last_response_complete']:
+        return None
+    suggestions = prefetcher.ready_suggestions()
+    if not suggestions:
+        return None
+    state = st.session_state.conversation_state
+    chosen = None
+    st.write("**Suggested follow-ups:**")
+    for index, suggestion in enumerate(suggestions):
+        # Predict the prompt each one would send; a summarizing window would need a request to do so
+        if client.context_window.summarize is None:
+            predicted = {'messages': state['messages'] + [new_message('user', suggestion)], 'summary': state.get('summary')}
+            prefetcher.prefetch(client.context_window.build(predicted))
+        if st.button(suggestion, key=f"suggestion_{index}"):
+            chosen = suggestion
+    return chosen
+
+
+# Function to generate the assistant's reply and display it
+def _generate_and_display(client, conversation_messages, prefill=False, placeholder=None):
+    """
+    Generates a response and displays it, token by token when streaming is enabled.
+    :param conversation_messages: List of messages (conversation history).
+    :param prefill: Whether the last message is a partial assistant turn to continue.
+    :param placeholder: st.empty() where the continued message is drawn, with the new text added to it.
+    :return: Response text, a boolean indicating if the response is complete, and
+             whether the text is the client's error message rather than a reply.
+    """
+    # A prefetched reply to exactly these messages is already under way
+    prefetcher = _prefetcher(client)
+    prefetched = prefetcher.take(conversation_messages, prefill) if prefetcher is not None else None
+    partial = conversation_messages[-1]['content'] if prefill and placeholder is not None else None
+    if not client.settings.stream_responses:
+        response, complete = prefetched or client.generate_response(conversation_messages, prefill=prefill)
+        failed = is_error_response(response)
+    else:
+        result = prefetched or client.generate_response_stream(conversation_messages, prefill=prefill)
+        if isinstance(result, ChatStream):
+            # Clicking "Stop" interrupts this run; the next one saves what arrived (see _save_stopped_response)
+            st.session_state.active_stream = {'stream': result, 'prefill': prefill}
+            response = _display_reply(result, partial, placeholder)
+            del st.session_state.active_stream
+            if result.error:
+                st.warning("The response was interrupted before it finished.")
+                return response, not response, False
+            return response, is_response_complete(response, result.finish_reason), False
+        # Instead of a stream, the client only returns its error message
+        response, complete, failed = result, True, True
+
+    # Error Handling: Check if response is an error message
+    if failed:
+        if placeholder is not None:
+            _display_reply("", partial, placeholder)
+        st.error(response)
+    else:
+        _display_reply(response, partial, placeholder)
+    return response, complete, failed
+
+
+# Function to keep the part of a reply whose stream the user stopped
+def _save_stopped_response():
+    """
+    Closes the interrupted stream, which stops the generation upstream, and stores
+    the text shown so far as an incomplete reply that "Continue" can resume.
+    """
+    active = st.session_state.pop('active_stream', None)
+    if active is None:
+        return
+    stream = active['stream']
+    stream.close()
+    state = st.session_state.conversation_state
+    store = get_conversation_store()
+    if active['prefill']:
+        state['messages'][-1]['content'] += stream.text
+        store.update_content(state['conversation_id'], state['messages'][-1]['id'], state['messages'][-1]['content'])
+    elif stream.text:
+        reply = new_message('assistant', stream.text)
+        state['messages'].append(reply)
+        store_message(store, reply)
+    else:
+        return
+    state['last_response_complete'] = False
+    save_conversation_state(store)
+
+
+# Function to resume the last, truncated assistant turn
+def _resume_response(client, placeholder=None):
+    """
+    Sends the partial assistant turn as a prefill so the model picks up where it
+    stopped, and stitches the generated text onto that same message.
+    :param placeholder: st.empty() where the message is drawn as it grows.
+    :return: True if the message was extended.
+    """
+    state = st.session_state.conversation_state
+    response, complete, failed = _generate_and_display(
+        client, client.context_window.build(state), prefill=True, placeholder=placeholder
+    )
+    if failed:
+        return False
+    state['messages'][-1]['content'] += response
+    state['last_response_complete'] = complete
+    store = get_conversation_store()
+    store.update_content(state['conversation_id'], state['messages'][-1]['id'], state['messages'][-1]['content'])
+    save_conversation_state(store)
+    return bool(response)
+
+
+# Function to keep continuing a truncated response up to the token cap
+def _auto_continue(client, placeholder=None):
+    state = st.session_state.conversation_state
+    while (not state['last_response_complete']
+           and count_tokens(state['messages'][-1]['content']) < client.settings.auto_continue_token_cap):
+        if not _resume_response(client, placeholder):
+            break
+
+
+# Function to handle continuation of incomplete responses
+def send_continue(client):
+    messages = st.session_state.conversation_state['messages']
+    if not messages:
+        st.warning("No previous response to continue.")
+        return
+
+    # Only the latest assistant turn can be resumed in place
+    if messages[-1]['role'] != 'assistant':
+        st.warning("No assistant response to continue from.")
+        return
+
+    _queue_reply(client, 'continue')
+
+
+# Function to cancel the speculative requests made for the current conversation
+def _cancel_prefetch():
+    if 'prefetcher' in st.session_state:
+        st.session_state.prefetcher.cancel()
+
+
+# Function to handle quitting the conversation
+def _handle_quit_conversation():
+    """Reset conversation state and display goodbye message"""
+    st.write("Goodbye!")
+    _cancel_prefetch()
+    start_new_conversation(get_conversation_store())
+    st.rerun()
+
+
+# Function to clear the conversation
+def _clear_conversation():
+    """Reset conversation state"""
+    _cancel_prefetch()
+    start_new_conversation(get_conversation_store())
+    st.rerun()
+
+
+# Function to generate the next reply in a new run
+def _queue_reply(client, kind):
+    """
+    Reruns the chat fragment to generate the reply inside the history. A streamed
+    reply reruns the whole page instead: a click on a widget outside the fragment
+    ("Stop") only interrupts full runs.
+    :param kind: 'reply' to answer the latest user message, 'continue' to resume the latest reply.
+    """
+    st.session_state.pending_reply = kind
+    if not client.settings.stream_responses:
+        try:
+            st.rerun(scope="fragment")
+        except StreamlitAPIException:
+            pass  # The click was handled in a full run (fragment reruns are only allowed in fragment runs)
+    st.rerun()
+
+
+# Function to generate the reply queued by _queue_reply
+def _generate_pending_reply(client, placeholder=None):
+    """
+    :param placeholder: st.empty() holding the latest message, which a continuation extends.
+    """
+    kind = st.session_state.pop('pending_reply')
+    if kind == 'reply':
+        _reply(client)
+    elif _resume_response(client, placeholder):
+        _auto_continue(client, placeholder)
+    _prefetch_next(client)
+
+
+# Function to handle user input
+def _handle_user_input(client, user_input):
+    """Update conversation state; the response is generated in the rerun this starts"""
+    store = get_conversation_store()
+    state = st.session_state.conversation_state
+    # Update Conversation History
+    message = new_message('user', user_input)
+    state['messages'].append(message)
+    store_message(store, message)
+    _queue_reply(client, 'reply')
+
+
+# Function to generate a reply to the latest user message and display it
+def _reply(client):
+    store = get_conversation_store()
+    state = st.session_state.conversation_state
+    # Fit the history into the prompt token budget, evicting the oldest turns
+    prompt_messages = client.context_window.build(state)
+    # Generate and display the response
+    response, complete, failed = _generate_and_display(client, prompt_messages)
+    # Update conversation history with assistant's reply
+    reply = new_message('assistant', response)
+    state['messages'].append(reply)
+    state['last_response_complete'] = complete
+    if not failed:
+        store_message(store, reply)
+    save_conversation_state(store)
+    # Resume truncated replies automatically when enabled
+    if not complete and not failed:
+        _auto_continue(client)
+
+
+# Chat box, rerun on its own when the user interacts with it
+@st.fragment
+def _chat(client, stop_button):
+    """
+    :param stop_button: Placeholder of the "Stop" button, drawn outside the fragment; cleared once the reply is done.
+    """
+    _save_stopped_response()
+    store = get_conversation_store()
+    # Create a container for the chat box
+    chat_container = st.container()
+
+    with chat_container:
+        # Display Conversation History
+        st.write("**Conversation History:**")
+        state = st.session_state.conversation_state
+        earlier = st.session_state.earlier_messages
+        oldest = (earlier or state['messages'] or [None])[0]
+        # Older messages stay in the store until the user asks for them
+        if oldest and store.has_earlier(state['conversation_id'], oldest['id']):
+            if st.button("Load earlier messages"):
+                earlier[:0] = store.load_page(
+                    state['conversation_id'], before_id=oldest['id'], limit=client.settings.history_page_size
+                )
+        messages = earlier + state['messages']
+        continuing = st.session_state.get('pending_reply') == 'continue' and bool(messages)
+        if not messages:
+            st.write("The conversation is empty. Start by typing your message below.")
+        else:
+            _markdown_cache().retain(messages)
+            for msg in messages[:-1] if continuing else messages:
+                display_message(msg['role'], msg['content'], msg.get('id'))
+        # The reply being continued is drawn by the continuation, which adds to it as it arrives
+        last_message = st.empty() if continuing else None
+        if 'pending_reply' in st.session_state:
+            _generate_pending_reply(client, last_message)
+            stop_button.empty()
+
+    # Chat input and submit button within a form
+    with st.form(key='chat_form'):
+        user_input = st.text_input("You:", value="", key="user_input")
+        submit_button = st.form_submit_button(label='Send')
+
+    if submit_button and user_input:
+        if user_input.lower() == 'quit':
+            _handle_quit_conversation()
+        else:
+            problem = validate_input(user_input)
+            if problem:
+                st.warning(problem)
+            else:
+                _handle_user_input(client, user_input)
+
+    # Display "Continue" Button if Last Response Was Incomplete
+    if not st.session_state.conversation_state['last_response_complete']:
+        if st.button("Continue"):
+            send_continue(client)
+
+    suggestion = _show_suggestions(client)
+    if suggestion:
+        _handle_user_input(client, suggestion)
+
+    # Option to clear the conversation
+    if st.button("Clear Conversation"):
+        _clear_conversation()
+
+
+# Function to run the chat page of an app
+def run_chat_app(settings):
+    """
+    :param settings: The app's core.config.ChatSettings.
+    """
+    client = get_chat_client(settings)
+
+    # Initialize Session State for Conversation State, resuming the conversation in the URL
+    init_conversation(get_conversation_store(), settings.history_page_size)
+
+    # Application Header with Logo (cached across reruns, with a bundled fallback for offline starts)
+    logo_image = load_image_from_url(logo_url, width=150, fallback="logo.png")  # Adjust width as needed
+    if logo_image:
+        st.sidebar.image(logo_image, use_container_width=True)
+    else:
+        st.sidebar.write("Logo could not be loaded.")
+
+    # **Adding the Model Description Below the Logo**
+    st.sidebar.markdown(model_description)
+
+    # Streamlit Interface
+    st.title("NVIDIA LLaMA Chatbot")
+    st.write("Welcome to the NVIDIA LLaMA Chatbot! Type 'quit' to exit the conversation.")
+
+    # Only a click outside the chat fragment interrupts the run streaming a reply
+    stop_button = st.empty()
+    if 'pending_reply' in st.session_state and settings.stream_responses:
+        stop_button.button("Stop", key="stop_stream")
+    _chat(client, stop_button)
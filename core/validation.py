@@ -0,0 +1,27 @@
+"""
+Validation of user input, shared by the apps.
+"""
+from core.context import count_tokens
+
+max_input_chars = 1000
+max_input_tokens = 500
+
+
+# Function to validate user input
+def validate_input(user_input):
+    """
+    Checks a message before it is added to the conversation.
+    :return: None if the input is valid, otherwise a message explaining why it is not.
+    """
+    if len(user_input.strip()) == 0:
+        return "Input cannot be empty."
+    if len(user_input) > max_input_chars:
+        return f"Input is too long. Please limit your message to {max_input_chars} characters."
+    try:
+        user_input.encode("utf-8")
+    except UnicodeEncodeError:
+        return "Input contains invalid characters."  # Lone surrogates, e.g. from a broken paste
+    # Dense text (code, non-Latin scripts) can be short in characters but long in tokens
+    if count_tokens(user_input) > max_input_tokens:
+        return f"Input is too long. Please limit your message to {max_input_tokens} tokens."
+    return None
@@ -0,0 +1,98 @@
+"""
+Runs several Streamlit workers of an app on one node, to use all its cores.
+
+The shared state server (core.shared_state) runs in this process and every
+worker is started with SHARED_STATE_ADDRESS pointing at it, so the workers
+share the response cache and the rate limits. Conversations are shared
+through the SQLite conversation store, so a resumed conversation URL works on
+any worker. Put a load balancer with sticky sessions in front of the ports:
+a Streamlit session stays on the websocket of the worker that serves it.
+
+Each worker builds its app's chat client before it starts serving, so with
+ChatSettings.warm_up the providers (e.g. a local model) are warmed up before
+the first user arrives. Use --workers 1 to get this for a single process.
+
+Usage:
+    python serve.py app.py --workers 4 --port 8501
+"""
+import argparse
+import importlib
+import logging
+import os
+import secrets
+import signal
+import subprocess
+import sys
+import time
+
+from core.shared_state import start_state_server
+
+
+# Function to run one worker: build the app's client, then serve the app in this process
+def run_worker(app, port):
+    """
+    The client is cached per process (core.client.get_chat_client), so the
+    sessions of this worker reuse the one built and warmed up here.
+    """
+    from streamlit.web import cli
+
+    from core.client import get_chat_client
+
+    sys.path.insert(0, os.path.dirname(os.path.abspath(app)))
+    settings = importlib.import_module(os.path.splitext(os.path.basename(app))[0]).settings
+    if settings.warm_up:
+        get_chat_client(settings)
+    cli.main(["run", app, "--server.port", str(port), "--server.headless", "true"], prog_name="streamlit")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run Streamlit workers of an app that share caches and rate limits")
+    parser.add_argument("app", help="Streamlit script to run, e.g. app.py")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Worker processes; defaults to one per core")
+    parser.add_argument("--port", type=int, default=8501, help="Port of the first worker; the others use the next ones")
+    parser.add_argument(
+        "--state-address", default=os.path.join(".cache", "shared_state.sock"),
+        help="Unix socket path (or host:port) of the shared state server"
+    )
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)  # Set on the processes started below
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if args.worker:
+        run_worker(args.app, args.port)
+        return
+    # Stop the workers too when a supervisor stops this process
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    if ":" not in args.state_address:
+        os.makedirs(os.path.dirname(os.path.abspath(args.state_address)), exist_ok=True)
+    # Connections unpickle what they receive, so the key must not be guessable; workers get it through the environment
+    authkey = os.getenv("SHARED_STATE_AUTHKEY") or secrets.token_hex(32)
+    server = start_state_server(args.state_address, key=authkey)
+    metrics_port = int(os.getenv("METRICS_PORT", "0"))
+
+    workers = []
+    for index in range(args.workers):
+        env = dict(os.environ, SHARED_STATE_ADDRESS=args.state_address, SHARED_STATE_AUTHKEY=authkey)
+        if metrics_port:
+            env["METRICS_PORT"] = str(metrics_port + index)  # One /metrics endpoint per worker
+        command = [sys.executable, os.path.abspath(__file__), args.app, "--worker", "--port", str(args.port + index)]
+        workers.append(subprocess.Popen(command, env=env))
+    logging.info(f"Started {len(workers)} workers of {args.app} on ports {args.port}-{args.port + len(workers) - 1}")
+
+    try:
+        # A worker that exits takes the others down, so a supervisor can restart the whole set
+        while all(worker.poll() is None for worker in workers):
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for worker in workers:
+            worker.terminate()
+        for worker in workers:
+            worker.wait()
+        server.close()
+
+
+if __name__ == "__main__":
+    main()
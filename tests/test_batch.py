@@ -0,0 +1,22 @@
+import json
+
+from batch import load_checkpoint, run_prompt
+from core.client import BUSY_ERROR
+
+
+class FakeClient:
+    def __init__(self, text):
+        self.text = text
+
+    def generate_response(self, messages):
+        return self.text, True
+
+
+def test_reply_mentioning_an_error_is_not_failed(tmp_path):
+    reply = "The traceback says an error occurred in parse(); the index is off by one."
+    results = [run_prompt(FakeClient(reply), "a", []), run_prompt(FakeClient(BUSY_ERROR), "b", [])]
+    assert [result["error"] for result in results] == [False, True]
+
+    checkpoint = tmp_path / "out.jsonl"
+    checkpoint.write_text("".join(json.dumps(result) + "\n" for result in results))
+    assert load_checkpoint(checkpoint) == {"a"}
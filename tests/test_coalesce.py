@@ -0,0 +1,80 @@
+import json
+import threading
+import time
+from concurrent.futures import Future
+
+from core.coalesce import InFlight, StreamFanout
+from core.streaming import ChatStream
+
+
+class FakeResponse:
+    """SSE response producing one delta per `delay` seconds."""
+
+    def __init__(self, deltas, delay=0.0):
+        self.deltas = deltas
+        self.delay = delay
+        self.closed = threading.Event()
+
+    def iter_lines(self):
+        for delta in self.deltas:
+            if self.closed.is_set():
+                return
+            time.sleep(self.delay)
+            yield "data: " + json.dumps({"choices": [{"delta": {"content": delta}}]})
+        yield "data: " + json.dumps({"choices": [{"delta": {}, "finish_reason": "stop"}]})
+        yield "data: [DONE]"
+
+    def close(self):
+        self.closed.set()
+
+
+def test_identical_requests_share_one_entry():
+    in_flight = InFlight()
+    leader_entry, leader = in_flight.join("key", Future)
+    follower_entry, follower = in_flight.join("key", Future)
+    assert leader and not follower and follower_entry is leader_entry
+
+    in_flight.leave("key", Future())  # Not the registered entry
+    assert len(in_flight) == 1
+    in_flight.leave("key", leader_entry)
+    assert len(in_flight) == 0
+    assert in_flight.join("key", Future)[1]
+
+
+def test_late_reader_replays_the_chunks_it_missed():
+    response = FakeResponse([f"chunk{index} " for index in range(10)], delay=0.01)
+    fanout = StreamFanout()
+    done = threading.Event()
+    leader = fanout.start(ChatStream(response), on_done=done.set)
+    leader_iter = iter(leader)
+    first = next(leader_iter)
+
+    follower = fanout.wait()
+    assert "".join(follower) == "".join(f"chunk{index} " for index in range(10))
+    assert first + "".join(leader_iter) == follower.text
+    assert leader.finish_reason == follower.finish_reason == "stop"
+    assert done.wait(1) and response.closed.is_set()
+
+
+def test_followers_get_the_leaders_error():
+    fanout = StreamFanout()
+    results = []
+    waiter = threading.Thread(target=lambda: results.append(fanout.wait()))
+    waiter.start()
+    fanout.fail("An error occurred while processing your request.")
+    waiter.join(1)
+    assert results == ["An error occurred while processing your request."]
+
+
+def test_upstream_is_cancelled_once_every_reader_left():
+    response = FakeResponse(["x"] * 500, delay=0.01)
+    fanout = StreamFanout()
+    done = threading.Event()
+    leader = fanout.start(ChatStream(response), on_done=done.set)
+    follower = fanout.wait()
+    next(iter(leader))
+    leader.close()
+    assert not fanout.cancelled  # The follower is still reading
+    follower.close()
+    assert done.wait(1) and response.closed.is_set()
+    assert fanout.cancelled and len(fanout.chunks) < 500
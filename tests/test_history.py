@@ -0,0 +1,24 @@
+import json
+
+import pytest
+
+from core.history import Message, encode_request
+
+
+@pytest.mark.parametrize("fields", [{}, {"model": "gpt-4o", "stream": True, "max_tokens": 512, "stop": ["\n\n"]}])
+def test_encode_request_round_trips(fields):
+    dicts = [
+        {"role": "system", "content": "Be brief."},
+        {"role": "user", "content": 'Quote "this", \\ and ünïcode\n'},
+    ]
+    records = [Message(msg["role"], msg["content"], "id-1") for msg in dicts]
+    for messages in (dicts, records, [records[0], dicts[1]]):
+        body = {**fields, "messages": messages}
+        assert json.loads(encode_request(body)) == {**fields, "messages": dicts}
+
+
+def test_encode_request_follows_message_edits():
+    message = Message("user", "before")
+    encode_request({"messages": [message]})
+    message.content = "after"
+    assert json.loads(encode_request({"messages": [message]}))["messages"][0]["content"] == "after"
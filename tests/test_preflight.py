@@ -0,0 +1,46 @@
+import pytest
+
+from core.context import count_message_tokens
+from core.preflight import PromptTooLongError, fit_request, min_reply_tokens
+
+
+def request(turns, max_tokens=1024):
+    messages = [{"role": "system", "content": "Be brief."}]
+    for index in range(turns):
+        messages.append({"role": "user", "content": f"question {index} " * 20})
+        messages.append({"role": "assistant", "content": f"answer {index} " * 20})
+    messages.append({"role": "user", "content": "latest question"})
+    return {"messages": messages, "max_tokens": max_tokens}
+
+
+def test_fitting_request_is_unchanged():
+    data = request(2)
+    assert fit_request(data, 100_000) == 0
+    assert data["max_tokens"] == 1024 and len(data["messages"]) == 6
+
+
+def test_max_tokens_is_lowered_first():
+    data = request(2)
+    context = count_message_tokens(data["messages"]) + min_reply_tokens + 10
+    assert fit_request(data, context) == 0
+    assert data["max_tokens"] == min_reply_tokens + 10
+    assert len(data["messages"]) == 6
+
+
+def test_oldest_turns_are_dropped():
+    data = request(5)
+    latest = data["messages"][-1]
+    context = count_message_tokens(data["messages"][:1] + data["messages"][-3:]) + min_reply_tokens
+    dropped = fit_request(data, context)
+    assert dropped > 0
+    assert data["messages"][0]["role"] == "system"
+    assert data["messages"][-1] is latest
+    assert count_message_tokens(data["messages"]) + data["max_tokens"] <= context
+    assert data["max_tokens"] >= min_reply_tokens
+
+
+def test_latest_turn_too_long():
+    data = request(0)
+    data["messages"][-1]["content"] = "word " * 2000
+    with pytest.raises(PromptTooLongError):
+        fit_request(data, 1000)
@@ -0,0 +1,100 @@
+import threading
+import time
+import uuid
+
+import pytest
+
+from core.providers import Provider, Router
+from core.ratelimit import RateLimitExceeded
+from core.retry import RetryPolicy
+
+
+class FakeResponse:
+    def __init__(self, status_code):
+        self.status_code = status_code
+        self.headers = {}
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class FakeTransport:
+    """Answers every POST with the next status code (or raises the next exception) after `delay` seconds."""
+
+    def __init__(self, *outcomes, delay=0.0):
+        self.outcomes = list(outcomes)
+        self.delay = delay
+        self.responses = []
+        self.threads = []
+
+    def post(self, url, headers=None, data=None, stream=False, timeout=None):
+        self.threads.append(threading.current_thread())
+        time.sleep(self.delay)
+        outcome = self.outcomes.pop(0) if len(self.outcomes) > 1 else self.outcomes[0]
+        if isinstance(outcome, Exception):
+            raise outcome
+        self.responses.append(FakeResponse(outcome))
+        return self.responses[-1]
+
+
+def provider(transport):
+    # A fresh name per test, so the process-wide latency statistics start empty
+    return Provider(f"test-{uuid.uuid4().hex[:8]}", "http://unused", None, "model", transport=transport)
+
+
+def router(*providers, hedge_after=0, retries=0):
+    return Router(providers, client=None, hedge_after=hedge_after, retry=RetryPolicy(retries=retries, base=0))
+
+
+DATA = {"messages": [{"role": "user", "content": "Hi"}], "max_tokens": 16}
+
+
+def test_fails_over_on_retryable_status_and_connection_errors():
+    first, second, third = FakeTransport(503), FakeTransport(ConnectionError("refused")), FakeTransport(200)
+    providers = [provider(first), provider(second), provider(third)]
+    answered, response = router(*providers).post(DATA)
+    assert answered is providers[2] and response.status_code == 200
+    assert first.responses[0].closed
+    # Unhedged attempts are sent from the caller's thread
+    assert {t for t in first.threads + second.threads + third.threads} == {threading.current_thread()}
+
+
+def test_returns_last_error_response_after_retries():
+    first, second = FakeTransport(500), FakeTransport(502)
+    answered, response = router(provider(first), provider(second), retries=2).post(DATA)
+    assert answered is None and response.status_code == 502
+    assert len(first.responses) == len(second.responses) == 3
+
+
+def test_client_errors_are_not_failed_over():
+    first, second = FakeTransport(400), FakeTransport(200)
+    providers = [provider(first), provider(second)]
+    answered, response = router(*providers).post(DATA)
+    assert answered is providers[0] and response.status_code == 400
+    assert not second.responses
+
+
+def test_slow_request_is_hedged_on_the_next_provider():
+    slow, fast = FakeTransport(200, delay=0.5), FakeTransport(200)
+    providers = [provider(slow), provider(fast)]
+    started = time.monotonic()
+    answered, response = router(*providers, hedge_after=0.05).post(DATA)
+    assert answered is providers[1]
+    assert time.monotonic() - started < 0.4
+    time.sleep(0.6)
+    assert slow.responses[0].closed  # The losing request is released once it returns
+
+
+class FullLimiter:
+    def acquire(self, tokens=0, max_wait=None):
+        raise RateLimitExceeded("Rate limit queue is full")
+
+
+def test_full_quota_queues_fail_without_retrying():
+    transport = FakeTransport(200)
+    first = provider(transport)
+    first.limiter = FullLimiter()
+    with pytest.raises(RateLimitExceeded):
+        router(first, retries=3).post(DATA)
+    assert not transport.responses
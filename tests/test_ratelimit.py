@@ -0,0 +1,60 @@
+import threading
+
+import pytest
+
+from core.ratelimit import RateLimiter, RateLimitExceeded, TokenBucket
+
+
+def test_reservations_queue_once_the_burst_is_used():
+    bucket = TokenBucket(60, capacity=2)  # One unit per second
+    waits = [bucket.reserve(1) for _ in range(4)]
+    assert waits[:2] == [0.0, 0.0]
+    assert waits[2] == pytest.approx(1.0, abs=0.05)
+    assert waits[3] == pytest.approx(2.0, abs=0.05)
+
+
+def test_rejected_reservation_takes_nothing():
+    bucket = TokenBucket(60, capacity=1)
+    bucket.reserve(1)
+    with pytest.raises(RateLimitExceeded):
+        bucket.reserve(5, max_wait=1)
+    assert bucket.reserve(1) == pytest.approx(1.0, abs=0.05)
+
+
+def test_refund_is_capped_at_capacity():
+    bucket = TokenBucket(60, capacity=3)
+    bucket.refund(10)
+    assert bucket.level == 3
+
+
+def test_concurrent_reservations_are_spread_out():
+    bucket = TokenBucket(60, capacity=5)
+    waits = []
+    lock = threading.Lock()
+
+    def reserve():
+        wait = bucket.reserve(1)
+        with lock:
+            waits.append(wait)
+
+    threads = [threading.Thread(target=reserve) for _ in range(10)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # Every caller gets its own slot: five immediately, then one per second
+    assert sorted(round(wait) for wait in waits) == [0, 0, 0, 0, 0, 1, 2, 3, 4, 5]
+
+
+def test_token_rejection_refunds_the_request():
+    limiter = RateLimiter(requests_per_minute=60, tokens_per_minute=100)
+    with pytest.raises(RateLimitExceeded):
+        limiter.acquire(tokens=1000, max_wait=0)
+    assert limiter.requests.level == pytest.approx(60, abs=0.1)
+    assert limiter.acquire(tokens=10, max_wait=0) == 0.0
+
+
+def test_acquire_sleeps_until_the_reservation_is_covered():
+    limiter = RateLimiter(requests_per_minute=600)  # Ten requests per second
+    limiter.requests.level = 0
+    assert limiter.acquire() == pytest.approx(0.1, abs=0.05)
@@ -0,0 +1,38 @@
+import json
+
+from core.streaming import ChatStream, truncate_at_stop
+
+
+class FakeResponse:
+    def __init__(self, deltas):
+        self.lines = [
+            "data: " + json.dumps({"choices": [{"delta": {"content": delta}}]}) for delta in deltas
+        ] + ["data: [DONE]"]
+        self.closed = False
+
+    def iter_lines(self):
+        return iter(self.lines)
+
+    def close(self):
+        self.closed = True
+
+
+def test_truncate_at_stop():
+    assert truncate_at_stop("one END two", ("END",)) == ("one ", True)
+    assert truncate_at_stop("one two", ("END",)) == ("one two", False)
+    assert truncate_at_stop("a;b.c", (".", ";")) == ("a", True)
+
+
+def test_stop_sequence_split_across_chunks():
+    response = FakeResponse(["Hello E", "N", "D world"])
+    stream = ChatStream(response, stop=("END",))
+    assert "".join(stream) == "Hello "
+    assert stream.finish_reason == "stop"
+    assert response.closed
+
+
+def test_held_back_text_is_released():
+    stream = ChatStream(FakeResponse(["Hello E", "N", "!"]), stop=("END",))
+    chunks = list(stream)
+    assert "".join(chunks) == "Hello EN!"
+    assert chunks[0] == "Hello"  # The last len("END") - 1 characters wait for the next chunk